@@ -12,454 +12,1336 @@
 # the import.
 #
 
+import collections
+import contextlib
+import functools
+import glob
 import os
 import sys
 import datetime
-import getpass
-import json
-import re
-import requests
-import xmltodict
-import pandas as pd
-from pathlib import Path
+import threading
 from bc_to_aspace_toolkit import utilities
-import xmltodict
+from bc_to_aspace_toolkit import config
+from bc_to_aspace_toolkit import disk_image
+from bc_to_aspace_toolkit import extract
+from bc_to_aspace_toolkit import lookup_cache
+from bc_to_aspace_toolkit import payloads
+from bc_to_aspace_toolkit import scanner
+from bc_to_aspace_toolkit import siegfried
+from bc_to_aspace_toolkit import summary
+from bc_to_aspace_toolkit import verify
+from bc_to_aspace_toolkit.metrics import Metrics
+from bc_to_aspace_toolkit.manifest import RunManifest, dataset_key, NEW, UNCHANGED
+from bc_to_aspace_toolkit.client import ArchivesSpaceClient, ArchivesSpaceError
+from bc_to_aspace_toolkit.export import ExportClient, replay_export
+from bc_to_aspace_toolkit.pipeline import Pipeline, COMPLETED, INTERRUPTED
 
 try:
     from argparse import ArgumentParser
 except ImportError:
     raise ImportError("This script requires ArgumentParser (Python 2.7/3.x)")
 
+# Dataset outcomes counted for each repository in the summary report
+REPOSITORY_OUTCOMES = ('uploaded', 'updated', 'unchanged', 'skipped', 'failed', 'errors')
 
-def get_dir_names(dir_path, exclude=['__pycache__', 'json_templates']):
+# The same for --dry-run and --export, where nothing is uploaded
+DRY_RUN_OUTCOMES = ('prepared', 'skipped', 'failed', 'errors')
+
+
+def create_parent_resource(project_folder, repository_uri, client, rollup=None):
     """
-    Get names of the first-level folders existed in a given folder
+    Create the resource of a project folder, with the extent and date
+    range of its datasets; without them, it is dated today with an
+    unknown extent
 
     Args:
-        dir_path (str): the path of the given folders;
-        exclude (array): the folders don't want to be retrieved;
+        project_folder (string): name of the project folder
+        repository_uri (string): URI of the repository
+        client (ArchivesSpaceClient): logged-in ArchivesSpace client
+        rollup (Rollup): aggregate of the datasets in the project folder
+
     Returns:
-        type: folder names (array).
+        type: URI of the new resource (string)
     """
-    dir_names = [dirs for root, dirs, files in os.walk(dir_path)][0]
-    results = []
-    for dir in dir_names:
-        if dir not in exclude:
-            path = dir_path + '/' + dir
-            if len(os.listdir(path)) > 0:
-                results.append(dir)
-    return results
+    if rollup is not None and rollup.begin is not None:
+        parent_resource = payloads.resource_payload(
+            project_folder, project_folder.replace(" ", "_"),
+            rollup.begin, rollup.end, rollup.megabytes())
+    else:
+        today = datetime.datetime.now()
+        parent_resource = payloads.resource_payload(
+            project_folder, project_folder.replace(" ", "_"), today, today)
+    return call_archivesspace_api(
+        client, 'post', repository_uri + '/resources', parent_resource)['uri']
 
 
-def create_json_file(template_name):
+def update_parent_resource(resource_uri, client, rollup):
     """
-    Create a json file using existing json templates
+    Replace the extent and date range of an existing project resource
+    with those of the datasets in its project folder
 
     Args:
-        template_name (string): the name of the json template
-        dir_path (string): the path of the folder with json templates
+        resource_uri (string): URI of the resource to update
+        client (ArchivesSpaceClient): logged-in ArchivesSpace client
+        rollup (Rollup): aggregate of the datasets in the project folder
 
     Returns:
-        type: a json file
+        type: backend response (json)
     """
-    template_stream = utilities.get_json_template(template_name + '.json')
-    template = json.load(template_stream)
-    print("  [INFO] Loaded template stream for {}".format(template_name + '.json'))
+    record = call_archivesspace_api(client, 'get', resource_uri)
+    resource = payloads.resource_payload(
+        record.get('title'), record.get('id_0'), rollup.begin, rollup.end, rollup.megabytes())
+    for field in ('dates', 'extents'):
+        record[field] = resource[field]
+    return call_archivesspace_api(client, 'post', resource_uri, record)
 
-    return template
 
-
-def load_dataset(file_name, dir_path):
+def call_archivesspace_api(client, action, api, data=""):
     """
-    load dataset
+    call ArchivesSpace api
 
     Args:
-        file_name (string): file name;
-        dir_path (string): the path of the folder with datasets
+        client (ArchivesSpaceClient): logged-in ArchivesSpace client
+        action (string): api action ("post" or "get")
+        api (string): API path
+        data: request body for "post"
 
     Returns:
-        type: dataset(pandas dataframe)
+        type: json file (json)
+
+    Raises:
+        ArchivesSpaceError: the request failed or was rejected
     """
-    dataset_path = dir_path + '/' + file_name + '.csv'
-    if os.path.isfile(dataset_path):
-        dataset = pd.read_csv(dataset_path)
-        print("  [INFO] Read dataset at {}".format(dataset_path))
-        return dataset
+    if action == "post":
+        return client.post(api, data)
+    elif action == 'get':
+        return client.get(api)
+    else:
+        print('  Please specify API action: "post" or "get"')
 
 
-def extract_date(time):
+def get_archival_objects(ref_ids, repository_uri, client, cache=None):
     """
-    extract '%Y-%m-%d' from datetime data
+    Get the archival objects in ArchivesSpace repository with the given ref_ids
 
     Args:
-        time (string): datetime
+        ref_ids (array): ids used to search for archival objects in the repository
+        repository_uri (string): the URI of the respiratory that will be retrieved from
+        client (ArchivesSpaceClient): logged-in ArchivesSpace client
+        cache (LookupCache): optional local index consulted before the backend
 
     Returns:
-        type: extracted date (datetime object)
+        type: dict mapping each ref_id that exists in the repository to
+            (archival object URI, resource URI)
     """
-    match = re.search('\d{4}-\d{2}-\d{2}', time)
-    date_extracted = datetime.datetime.strptime(
-        match.group(), '%Y-%m-%d').date()
-    return date_extracted
-
-
-def get_sessionId(host, username, password):
+    archival_objects = {}
+    if cache is not None:
+        archival_objects.update(cache.get_archival_objects(repository_uri, ref_ids))
+
+    missing = [ref_id for ref_id in ref_ids if ref_id not in archival_objects]
+    if missing:
+        records = lookup_cache.find_archival_objects(client, repository_uri, missing)
+        for ref_id, record in records.items():
+            resource_uri = record.get('resource', {}).get('ref', '')
+            archival_objects[ref_id] = (record['uri'], resource_uri)
+            if cache is not None:
+                cache.put_archival_object(repository_uri, ref_id, record['uri'], resource_uri)
+    return archival_objects
+
+
+def get_repository_uri(repo_code, client, cache=None):
     """
-    Get session id from ArchivesSpace backend
+    Get a repository uri in ArchivesSpace database using a given repo_code
 
     Args:
-        host (string): API URL
-        username (string): username of your ArchivesSpace account
-        password (string): password of your ArchivesSpace account
+        repo_code (string): a given id used to search for repositories in database
+        client (ArchivesSpaceClient): logged-in ArchivesSpace client
+        cache (LookupCache): optional local index consulted before the backend
 
     Returns:
-        type : session id(string)
+        type: return a repository URI if repo_code exists in the database;
+            otherwise, return ""
     """
-    url = host + '/users/' + username + '/login'
-    params = {
-        'password': password
-    }
-    authentication = requests.post(url, params=params).json()
-    return authentication['session']
+    if cache is not None:
+        repository_uri = cache.get_repository_uri(repo_code)
+        if repository_uri:
+            return repository_uri
+
+    repository_list = call_archivesspace_api(
+        client, 'get', '/repositories')
+    if cache is not None:
+        cache.put_repositories(repository_list)
+    repository_uri = ''
+    for repository in repository_list:
+        if repository['repo_code'] == repo_code:
+            repository_uri = repository['uri']
+    return repository_uri
 
 
-def call_archivesspace_api(host, session_id, action, api, data=""):
+def get_child_uris(parent_archival_object_uri, client):
     """
-    call ArchivesSpace api
+    Get the URIs of the children of an archival object
 
     Args:
-        host (string): api URL
-        session_id (string): session id retreived from ArchivesSpace backend
-        action (string): api action ("post" or "get")
+        parent_archival_object_uri (string): URI of the parent archival object
+        client (ArchivesSpaceClient): logged-in ArchivesSpace client
 
     Returns:
-        type: json file (json)
-
-    Raises:
-        Exception: error code
+        type: dict mapping child titles to their URIs
     """
-    url = host + api
-    headers = {
-        'X-ArchivesSpace-Session': session_id
-    }
-
-    if action == "post":
-        result = requests.post(url, headers=headers,
-                               data=json.dumps(data)).json()
-        return result
-    elif action == 'get':
-        result = requests.get(url, headers=headers).json()
-        return result
-    else:
-        print('  Please specify API action: "post" or "get"')
+    children = call_archivesspace_api(
+        client, 'get', parent_archival_object_uri + '/children')
+    return dict((child['title'], child['uri']) for child in children)
 
 
-def get_archival_object(ref_id, repository_uri, session_id, host):
+def get_child_uris_by_ref_id(repository_uri, ref_ids, client):
     """
-    Get a archival object in ArchivesSpace repository using a given ref_id
+    Get the URIs of child archival objects from their ref_ids
 
     Args:
-        repository_uri (string): the URI of the respiratory that will be retrieved from
-        ref_id (string): a given id used to search for archival objects in the repository
-        session_id (string): session_id
-        host (string): API URL
+        repository_uri (string): URI of the repository
+        ref_ids (array): ref_ids given to the children by child_ref_id
+        client (ArchivesSpaceClient): logged-in ArchivesSpace client
 
     Returns:
-        type: return an archival object if ref_id exists in the repository;
-            otherwise, return ""
+        type: dict mapping the ref_ids found to their URIs
     """
-    archival_object_output = ''
-    check_ref_id_api = repository_uri + \
-        '/find_by_id/archival_objects?ref_id[]=' + ref_id
-    archival_object_ids = call_archivesspace_api(
-        host, session_id, 'get', check_ref_id_api)
-    if len(archival_object_ids['archival_objects']) > 0:
-        archival_object_api = archival_object_ids['archival_objects'][0]['ref']
-        archival_object_output = call_archivesspace_api(
-            host, session_id, 'get', archival_object_api)
-    return archival_object_output
+    records = lookup_cache.find_archival_objects(client, repository_uri, ref_ids)
+    return dict((ref_id, record['uri']) for ref_id, record in records.items())
 
 
-def get_repository_uri(repo_code, session_id, host):
+def update_archival_object(uri, child, client):
     """
-    Get a repository uri in ArchivesSpace database using a given repo_code
+    Replace the extracted metadata of an existing archival object
 
     Args:
-        repo_code (string): a given id used to search for repositories in database
-        session_id (string): session_id
-        host (string): api URL
+        uri (string): URI of the archival object to update
+        child (dict): child archival object built by the extraction stage
+        client (ArchivesSpaceClient): logged-in ArchivesSpace client
 
     Returns:
-        type: return a repository URI if repo_code exists in the database;
-            otherwise, return ""
+        type: backend response (json)
     """
-    repository_list = call_archivesspace_api(
-        host, session_id, 'get', '/repositories')
-    repository_uri = ''
-    for repository in repository_list:
-        if repository['repo_code'] == repo_code:
-            repository_uri = repository['uri']
-    return repository_uri
+    record = call_archivesspace_api(client, 'get', uri)
+    for field in ('title', 'level', 'dates', 'extents', 'notes'):
+        record[field] = child[field]
+    return call_archivesspace_api(client, 'post', uri, record)
 
 
-def xmlConvertToJson (file_path):
+def resolve_fallback(result, options):
     """
-    convert xml to Josn
+    Decide whether a dataset without DFXML timestamps is uploaded using
+    the dates from Siegfried instead
+
     Args:
-        file_path: path of the dfxml(xml) file
+        result (DatasetResult): extracted dataset needing a fallback
+        options (Namespace): parsed command line options
+
     Returns:
-        json file: reutn the json format of the input file
+        type: True to upload with Siegfried dates, False to skip the dataset
     """
-    with open(file_path, 'r') as f:
-        xmlFile = f.read()
-    jsonFile = json.dumps(xmltodict.parse(xmlFile), indent=4)
-    print("  [INFO] Read dataset at {}".format(file_path))
-    return json.loads(jsonFile)
+    if result.dfxml_missing:
+        print("  [WARNING] No dfxml.xml found for dataset {}".format(result.dataset_dir))
+        policy = options.on_missing_dfxml
+    else:
+        print("  [WARNING] No modified times found in DFXML for files in dataset {}".format(result.dataset_dir))
+        policy = options.on_missing_mtimes
 
+    if policy == 'ask' and options.assume_yes:
+        policy = 'siegfried'
 
-def run_session(dir_path):
+    if policy == 'ask':
+        print("            Type N and hit enter at the following prompt to")
+        print("            skip this dataset, or y to continue processing")
+        print("            using timestamps from Siegfried.")
+        use_siegfried = utilities.ask_user("Continue processing this dataset using Siegfried timestamps?")
+    else:
+        use_siegfried = policy == 'siegfried'
 
-    if sys.version_info[0] < 3:
-        host = raw_input('ArchivesSpace backend URL: ')
-        username = raw_input('Username: ')
-        password = getpass.getpass(prompt='Password: ')
-        created_by = raw_input('Created by: ')
+    if use_siegfried:
+        print("  [INFO] Continuing, using dates from Siegfried...")
     else:
-        host = input('ArchivesSpace backend URL: ')
-        username = input('Username: ')
-        password = getpass.getpass(prompt='Password: ')
-        created_by = input('Created by: ')
+        print("  [INFO] Skipping, moving to next dataset...")
+    return use_siegfried
+
+
+def connect(options, file_credentials=None, metrics=None):
+    """
+    Log in to the ArchivesSpace backend, asking again for credentials if
+    the login fails and prompting is allowed
+
+    Args:
+        options (Namespace): parsed command line options (see build_parser)
+        file_credentials (dict): credentials read from a configuration file
+        metrics (Metrics): collector of request counts and latencies
+
+    Returns:
+        type: (logged-in ArchivesSpaceClient, backend URL)
+    """
+    try:
+        credentials = config.get_credentials(file_credentials,
+                                             not options.non_interactive)
+    except config.ConfigError as e:
+        print("  [ABORT] {}".format(e))
+        exit(1)
+    host = credentials['url']
 
     # retrieve session id
+    client = ArchivesSpaceClient(host, credentials['username'], credentials['password'],
+                                 metrics=metrics)
     try:
-        session_id = get_sessionId(host, username, password)
+        client.login()
         print("  Connected to ArchivesSpace backend!")
-    except:
+    except ArchivesSpaceError:
+        if options.assume_yes:
+            print("  [ABORT] Username, password, or URL was incorrect. Quitting...")
+            exit(1)
         user_response = utilities.ask_user("Username, password, or URL was incorrect.  Try again?")
         if user_response == False:
             print("  [ABORT] Quitting...")
             exit(1)
         else:
-            return run_session(dir_path)
+            return connect(options, file_credentials, metrics)
+
+    return client, host
+
+
+def build_rollups(project_folders, results_by_project, unchanged, use_summary_cache,
+                  image_engine=None):
+    """
+    Merge dataset summaries into one Rollup per project folder
+
+    Args:
+        project_folders (array): names of the project folders
+        results_by_project (dict): DatasetResult objects to be uploaded,
+            by project folder
+        unchanged (array): DatasetEntry objects skipped as already uploaded
+        use_summary_cache (bool): include the unchanged datasets, from
+            their cached summaries
+        image_engine (string): engine disk images are read with, if any
+
+    Returns:
+        type: dict mapping project folders to Rollup objects
+    """
+    rollups = dict((project_folder, summary.Rollup()) for project_folder in project_folders)
+    for project_folder in project_folders:
+        for result in results_by_project[project_folder]:
+            rollups[project_folder].add_summary(result.summary)
+    if use_summary_cache:
+        for dataset in unchanged:
+            cached = summary.load_summary(dataset.path, summary.fingerprint(
+                dataset.path, extract.summary_inputs(dataset, image_engine),
+                extract.summary_engine(dataset, image_engine)))
+            if cached is not None:
+                rollups[dataset.project].add_summary(cached)
+    return rollups
+
+
+class RepositoryRun(object):
+    """
+    State of one local repository directory through a session
+
+    Attributes:
+        dir_path (string): path of the local repository directory
+        name (string): name of the directory, used as the repo_code
+        inventory (RepositoryInventory): scan of dir_path
+        concurrency (int): maximum simultaneous uploads for this repository
+        repository_uri (string): URI of the ArchivesSpace repository
+        manifest (RunManifest): run manifest of dir_path (None if disabled)
+        fingerprints (dict): input fingerprints by dataset key
+        states (dict): manifest states by dataset key
+        jobs (array): DatasetEntry objects to extract
+        unchanged (array): DatasetEntry objects skipped as already uploaded
+        parents (dict): (parent archival object URI, parent resource URI)
+            by project ref_id
+        rollups (dict): Rollup objects by project folder
+        partial_rollups (set): project folders with datasets uploaded by
+            earlier runs that are missing from their rollup, for want of
+            a cached summary
+        pending (dict): reviewed DatasetResult objects not yet queued for
+            upload, by project folder
+        remaining (dict): number of datasets not yet reviewed, by project
+            folder
+        group_size (int): datasets queued for upload together once the
+            parent records of their project exist
+        started (set): project folders whose upload has begun
+        lock (Lock): held while a group of this repository is uploaded
+        prefix_metrics (bool): prefix per-dataset metrics with the name
+        counts (dict): dataset outcomes, for the summary report
+    """
+
+    def __init__(self, dir_path, inventory=None, concurrency=4):
+        self.dir_path = dir_path
+        self.name = os.path.basename(dir_path)
+        self.inventory = inventory
+        self.concurrency = concurrency
+        self.repository_uri = ''
+        self.manifest = None
+        self.fingerprints = {}
+        self.states = {}
+        self.jobs = []
+        self.unchanged = []
+        self.parents = {}
+        self.rollups = {}
+        self.partial_rollups = set()
+        self.pending = {}
+        self.remaining = {}
+        self.group_size = None
+        self.started = set()
+        self.lock = threading.Lock()
+        self.prefix_metrics = False
+        self.counts = dict((outcome, 0) for outcome in REPOSITORY_OUTCOMES + DRY_RUN_OUTCOMES)
+
+    def project_folders(self):
+        return [project.name for project in self.inventory.projects]
+
+    def rollup(self):
+        """
+        Returns:
+            type: Rollup of every project folder of the repository
+        """
+        repository_rollup = summary.Rollup()
+        for project_folder in self.project_folders():
+            repository_rollup.merge(self.rollups[project_folder])
+        return repository_rollup
+
+
+class Progress(object):
+    """
+    Count of the datasets handled so far, across all repositories
+
+    Datasets are counted from the review and from several upload threads
+    at once. Only uploads are reported; datasets dropped at review are
+    counted silently.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def advance(self, count, label=None):
+        with self._lock:
+            self.done += count
+            if label is not None:
+                print("  [PROGRESS] {}/{} datasets handled ({})".format(self.done, self.total, label))
+
+
+class LineSynchronizedStream(object):
+    """
+    Wraps a text stream so that lines printed from several threads at once
+    are written whole rather than interleaved
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+        self._pending = threading.local()
+
+    def write(self, text):
+        lines, newline, rest = (getattr(self._pending, 'text', '') + text).rpartition('\n')
+        if newline:
+            with self._lock:
+                self.stream.write(lines + newline)
+        self._pending.text = rest
+        return len(text)
+
+    def flush(self):
+        # Partial lines are written too, e.g. the question of a prompt
+        rest = getattr(self._pending, 'text', '')
+        self._pending.text = ''
+        with self._lock:
+            self.stream.write(rest)
+            self.stream.flush()
+
+
+def expand_repository_dirs(patterns):
+    """
+    Expand the repodir arguments into repository directories
+
+    Args:
+        patterns (array): directory paths or glob patterns, e.g.
+            "/data/repositories/*"
+
+    Returns:
+        type: paths of the repository directories, without duplicates (array)
+    """
+    dir_paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(path for path in glob.glob(pattern) if os.path.isdir(path))
+            if not matches:
+                print("  [ABORT] No directories match {}. Check the pattern and try again.".format(pattern))
+                exit(1)
+        elif os.path.isdir(pattern):
+            matches = [pattern]
+        else:
+            print("  [ABORT] The directory {} does not exist. You must use the full path to the local directory corresponding to the repository structure. Check the path and directory name and try again.".format(pattern))
+            exit(1)
+        for path in matches:
+            path = path.rstrip('/')
+            if path not in dir_paths:
+                dir_paths.append(path)
+    return dir_paths
+
+
+def parse_repository_limits(values):
+    """
+    Parse --repository-concurrency values of the form REPOSITORY=N
+
+    Args:
+        values: list of values, or one comma separated string (as read
+            from a configuration file)
+
+    Returns:
+        type: dict mapping repository folder names to limits
 
+    Raises:
+        ValueError: a value is not of the form REPOSITORY=N, with N >= 1
+    """
+    if not values:
+        return {}
+    if isinstance(values, str):
+        values = values.split(',')
+    limits = {}
+    for value in values:
+        name, _, limit = value.strip().rpartition('=')
+        if not name or not limit.isdigit() or int(limit) < 1:
+            raise ValueError("invalid --repository-concurrency value {!r}; expected REPOSITORY=N".format(value))
+        limits[name] = int(limit)
+    return limits
+
+
+def prepare_repository(run, options, client, cache, metrics):
+    """
+    Look up the ArchivesSpace repository of a repository directory, split
+    its datasets into those to extract and those the run manifest shows as
+    already uploaded, and look up the parent records of their projects
+
+    Returns:
+        type: True, or False if the repository does not exist in ArchivesSpace
+    """
     # Search for a repository using the name of the repository folder;
     #     If the repository does not exist, create one using
     #     the name of this repository folder as a repo_code.
-    repository_folder = os.path.basename(dir_path)
-    repository_uri = get_repository_uri(repository_folder, session_id, host)
+    run.repository_uri = get_repository_uri(run.name, client, cache)
+    if run.repository_uri == '':
+        return False
+    print("  [INFO] Found the repository: {}".format(run.repository_uri))
+
+    # Datasets recorded in the run manifest as uploaded, whose inputs
+    #     have not changed since, are skipped.
+    if not options.no_manifest:
+        run.manifest = RunManifest(run.dir_path, options.hash_inputs, client.host)
+    if run.inventory is None:
+        with metrics.timer('scan'):
+            run.inventory = scanner.scan_repository(run.dir_path, options.workers)
+    image_engine = options.image_engine if options.from_image else None
+    for dataset in run.inventory.datasets():
+        if run.manifest is not None:
+            key = dataset_key(dataset.project, dataset.name)
+            # The same files as the summary cache, so that a dataset read
+            #     from its disk image is uploaded again if the image changes
+            run.fingerprints[key] = run.manifest.fingerprint(
+                dataset.path, extract.summary_inputs(dataset, image_engine),
+                extract.summary_engine(dataset, image_engine))
+            run.states[key] = run.manifest.status(key, run.fingerprints[key])
+            if run.states[key] == UNCHANGED:
+                print("  [INFO] Skipping unchanged dataset {}/{}".format(dataset.project, dataset.name))
+                run.unchanged.append(dataset)
+                continue
+        run.jobs.append(dataset)
+    run.counts['unchanged'] = len(run.unchanged)
+
+    # Look up the parent archival objects of every project folder with
+    #     datasets to upload
+    ref_ids = sorted(set(dataset.project.replace(" ", '_') for dataset in run.jobs))
+    if ref_ids:
+        with metrics.timer('parent_lookup'):
+            run.parents = get_archival_objects(ref_ids, run.repository_uri, client, cache)
+    return True
+
+
+def streams(run, project_folder):
+    """
+    Returns:
+        type: True if the parent archival object and resource of a project
+            folder already exist, so that its datasets can be uploaded as
+            they are extracted rather than once the whole project is read
+    """
+    parent_archival_object_uri, parent_resource_uri = run.parents.get(
+        project_folder.replace(" ", '_'), ('', ''))
+    return parent_archival_object_uri != '' and parent_resource_uri != ''
 
-    if repository_uri == '':
-        print("  [ERROR] The repository {} does not exist in this ArchivesSpace instance. Exiting.".format(repository_folder))
-        exit(1)
-    else:
-        print("  [INFO] Found the repository: {}".format(repository_uri))
 
-    # Find the path of the preject folders in the repository folder.
-    # project_folder_paths = dir_path + '/' + repository_folder
+def review_result(run, result, options, pipeline, metrics, progress):
+    """
+    Review one extracted dataset, in the order the datasets were queued:
+    report it if it could not be read or has no DFXML timestamps, settle
+    its Siegfried fallback (according to --on-missing-dfxml and
+    --on-missing-mtimes), and queue the datasets to be uploaded in groups
+
+    Args:
+        run (RepositoryRun): repository the dataset belongs to
+        result (DatasetResult): the extracted dataset
+        options (Namespace): parsed command line options
+        pipeline (Pipeline): pipeline the dataset came through
+        metrics (Metrics): collector of stage timings and counts
+        progress (Progress): count of the datasets handled so far
+    """
+    project_folder = result.project_folder
+    key = dataset_key(project_folder, result.dataset_dir)
+    metrics.add_dataset(run.name + '/' + key if run.prefix_metrics else key, result.metrics)
+    run.remaining[project_folder] -= 1
+
+    for message in result.messages:
+        print(message)
+    accepted = False
+    if result.error is not None:
+        print("  [ERROR] Could not process dataset {}: {}".format(
+            result.dataset_dir, result.error))
+        run.counts['errors'] += 1
+    elif result.payload is None:
+        run.counts['skipped'] += 1
+    elif result.needs_fallback() and not resolve_fallback(result, options):
+        run.counts['skipped'] += 1
+    else:
+        accepted = True
+        run.rollups[project_folder].add_summary(result.summary)
+        run.pending[project_folder].append(result)
+
+    # Datasets of a project whose parent records do not exist yet wait
+    #     for the rest of the project, whose rollup the resource is
+    #     created from; they give back their permits now so that a large
+    #     project cannot stall extraction.
+    streaming = streams(run, project_folder)
+    if not accepted:
+        pipeline.release()
+        progress.advance(1)
+    elif not streaming:
+        pipeline.release()
+
+    # The resource of a project whose parent records already existed
+    #     was dated by an earlier run; once the whole project is reviewed
+    #     its extent and dates are brought up to date from the rollup,
+    #     unless datasets of those earlier runs are missing from it.
+    pending = run.pending[project_folder]
+    complete = run.remaining[project_folder] == 0
+    refresh = complete and streaming and project_folder not in run.partial_rollups
+    if (pending or refresh) and (complete or (streaming and run.group_size is not None and
+                                              len(pending) >= run.group_size)):
+        pipeline.submit_upload((run, project_folder, pending,
+                                len(pending) if streaming else 0, refresh))
+        run.pending[project_folder] = []
+    if complete:
+        print("  [INFO] Project {}: {}".format(project_folder, run.rollups[project_folder].describe()))
+
+
+def resolve_parent(run, project_folder, client, cache):
+    """
+    Find the parent archival object and resource of a project folder,
+    creating whichever is missing
 
-    # For each project folder in the repository folder:
-    #     Search for a parent archive object using the name of the project folder;
+    Returns:
+        type: (parent archival object URI, parent resource URI)
+    """
+    # Search for a parent archive object using the name of the project folder;
     #     If this parent archival object does not exist, create one using
     #         the name of the project folder as a ref_id.
     #     If this parent archival object exists, but its resouce is missing, create
     #     a new resource.
-    for project_folder in get_dir_names(dir_path):
-        print("  [INFO] Processing project folder {}".format(project_folder))
-        ref_id_parent = project_folder.replace(" ", '_')
+    repository_uri = run.repository_uri
+    ref_id_parent = project_folder.replace(" ", '_')
+    parent_archival_object_uri, parent_resource_uri = run.parents.get(ref_id_parent, ('', ''))
+
+    if parent_archival_object_uri == '':
+        parent_resource_uri = create_parent_resource(
+            project_folder, repository_uri, client, run.rollups[project_folder])
+        parent_object = payloads.archival_object_payload(
+            project_folder, ref_id_parent, parent_resource_uri)
+        parent_object_api = repository_uri + '/archival_objects'
+        parent_archival_object_uri = call_archivesspace_api(
+            client, 'post', parent_object_api, parent_object)['uri']
+        if cache is not None:
+            cache.put_archival_object(repository_uri, ref_id_parent,
+                                      parent_archival_object_uri, parent_resource_uri)
+    elif parent_resource_uri == '':
+        parent_resource_uri = create_parent_resource(
+            project_folder, repository_uri, client, run.rollups[project_folder])
+        if cache is not None:
+            cache.put_archival_object(repository_uri, ref_id_parent,
+                                      parent_archival_object_uri, parent_resource_uri)
+
+    run.parents[ref_id_parent] = (parent_archival_object_uri, parent_resource_uri)
+    return parent_archival_object_uri, parent_resource_uri
+
+
+def upload_group(task, options, client, cache, metrics, pipeline, progress):
+    """
+    Upload or update the child archival objects of a group of datasets of
+    one project folder, in an upload thread of the pipeline
 
-        parent_archival_object = get_archival_object(
-            ref_id_parent, repository_uri, session_id, host)
+    Groups of the same repository are uploaded one at a time, so that its
+    --repository-concurrency limit holds.
 
-        if parent_archival_object != '':
-            parent_resource_uri = parent_archival_object['resource']['ref']
-            parent_archival_object_uri = parent_archival_object['uri']
-        else:
-            parent_resource_uri = ''
-            parent_archival_object_uri = ''
-
-        if parent_archival_object_uri == '':
-            parent_resource = create_json_file('create_resources')
-            parent_resource['id_0'] = project_folder.replace(" ", "_")
-            parent_resource['dates'][0]['begin'] = datetime.datetime.now().strftime(
-                '%Y-%m-%d')
-            parent_resource['dates'][0]['end'] = datetime.datetime.now().strftime(
-                '%Y-%m-%d')
-            parent_resource['extents'][0]['number'] = 'Unknown'
-            parent_resource['notes'] = []
-            parent_resource['level'] = 'file'
-            parent_resource['title'] = project_folder
-            resource_api = repository_uri + '/resources'
-            parent_resource_uri = call_archivesspace_api(
-                host, session_id, 'post', resource_api, parent_resource)['uri']
-
-            parent_object = create_json_file('create_archival_objects')
-            parent_object['title'] = project_folder
-            parent_object['level'] = 'file'
-            parent_object['ref_id'] = ref_id_parent
-            parent_object['resource']['ref'] = parent_resource_uri
-            parent_object['dates'] = []
-            parent_object['extents'] = []
-            parent_object['notes'] = []
-            parent_object_api = repository_uri + '/archival_objects'
-            parent_archival_object_uri = call_archivesspace_api(
-                host, session_id, 'post', parent_object_api, parent_object)['uri']
-        else:
-            if parent_resource_uri == '':
-                parent_resource = create_json_file('create_resources')
-                parent_resource['id_0'] = project_folder.replace(" ", "_")
-                parent_resource['dates'][0]['begin'] = datetime.datetime.now().strftime(
-                    '%Y-%m-%d')
-                parent_resource['dates'][0]['end'] = datetime.datetime.now().strftime(
-                    '%Y-%m-%d')
-                parent_resource['extents'][0]['number'] = 'Unknown'
-                parent_resource['notes'] = []
-                parent_resource['level'] = 'file'
-                parent_resource['title'] = project_folder
-                resource_api = repository_uri + '/resources'
-                parent_resource_uri = call_archivesspace_api(
-                    host, session_id, 'post', resource_api, parent_resource)['uri']
-
-        # Find the path of the files in the project folder
-        file_folder_path = dir_path + '/' + project_folder
-        print("  [INFO] Entering project folder path {}".format(file_folder_path))
-
-        # For all the files in the project folder:
-        #     Create a child archival object in ArchivesSpace
-        #         using the combination of the project folder's name and
-        #         the file's name as a ref_id.
-        for file in get_dir_names(file_folder_path):
-            print("  [INFO] Found dataset directory {}".format(file))
-            # extract file name
-            file_name = file.split("_")[0]
-            print("  [INFO] Using reference ID {}".format(file_name))
-            # Find the path of each file
-            file_path = file_folder_path + '/' + file
-            file_csv_report_path = file_folder_path + '/' + file + '/csv_reports'
-            child_archival_object = create_json_file('create_child_archival_objects')
-
-            # load datasets
-            formats = load_dataset('formats', file_csv_report_path)
-            siegfried = load_dataset('siegfried', file_path)
-
-            # use siegfried dates by default, overwrite if dfxml present
-            end_date = extract_date(max(siegfried['modified']))
-            begin_date = extract_date(min(siegfried['modified']))
-
-            dfxml_path = file_folder_path + '/' + file + '/dfxml.xml'
-
-            # If no DFXML exists, warn and optionally default to Siegfried dates
-            if not os.path.isfile(dfxml_path):
-                print("  [WARNING] No dfxml.xml found for dataset {}".format(file))
-                print("            Type N and hit enter at the following prompt to")
-                print("            skip this dataset, or y to continue processing")
-                print("            using timestamps from Siegfried.")
-                user_response = utilities.ask_user("Continue processing this dataset using Siegfried timestamps?")
-                if user_response == False:
-                    print("  [INFO] Skipping, moving to next dataset...")
+    Args:
+        task (tuple): (RepositoryRun, project folder, DatasetResult objects,
+            number of pipeline permits the group holds, True if the group
+            completes a project whose resource existed before the run)
+    """
+    run, project_folder, uploads, permits, refresh = task
+    try:
+        with run.lock:
+            if uploads:
+                _upload_group(run, project_folder, uploads, options, client, cache, metrics)
+            if refresh:
+                _refresh_resource(run, project_folder, client)
+        if uploads:
+            progress.advance(len(uploads), run.name + '/' + project_folder)
+    finally:
+        pipeline.release(permits)
+
+
+def _refresh_resource(run, project_folder, client):
+    rollup = run.rollups[project_folder]
+    if rollup.begin is None:
+        return
+    parent_resource_uri = run.parents[project_folder.replace(" ", '_')][1]
+    try:
+        update_parent_resource(parent_resource_uri, client, rollup)
+    except ArchivesSpaceError as e:
+        print("  [ERROR] Could not update the extent and dates of {}: {}".format(
+            parent_resource_uri, e))
+        return
+    print("  [STATUS] Updated the extent and dates of {} ({})".format(
+        parent_resource_uri, project_folder))
+
+
+def _upload_group(run, project_folder, uploads, options, client, cache, metrics):
+    manifest = run.manifest
+    if project_folder not in run.started:
+        run.started.add(project_folder)
+        print("  [INFO] Processing project folder {}".format(project_folder))
+    parent_archival_object_uri, parent_resource_uri = resolve_parent(
+        run, project_folder, client, cache)
+    for result in uploads:
+        result.payload['children'][0]['resource']['ref'] = parent_resource_uri
+
+    # Datasets uploaded by an earlier run are updated in place; other
+    #     datasets the manifest has seen before (e.g. after an interrupted
+    #     run) are only posted again if the parent does not have them yet.
+    updates = []
+    if manifest is not None:
+        existing_children = None
+        new_uploads = []
+        for result in uploads:
+            key = dataset_key(project_folder, result.dataset_dir)
+            if manifest.uri(key):
+                updates.append((result, manifest.uri(key)))
+                continue
+            if run.states[key] != NEW:
+                if existing_children is None:
+                    existing_children = get_child_uris(parent_archival_object_uri, client)
+                if result.file_name in existing_children:
+                    print("  [INFO] Dataset {} was already uploaded by an interrupted run".format(
+                        result.file_name))
+                    manifest.record_done(key, run.fingerprints[key],
+                                         existing_children[result.file_name])
+                    run.counts['uploaded'] += 1
                     continue
-                else:
-                    print("  [INFO] Continuing, using dates from Siegfried...")
-
-            # If DFXML exists, use modified dates or warn and optionally default to
-            # Siegfried dates if no modified dates are found (e.g. CD-ROM)
-            if os.path.isfile(dfxml_path):
-                dfxml_files = xmlConvertToJson(dfxml_path)['dfxml']
-                if 'volume' in dfxml_files:
-                    dfxml_file_objects = dfxml_files['volume']['fileobject']
-                else:
-                    dfxml_file_objects = dfxml_files['fileobject']
-
-                modified_time = []
-                for file in dfxml_file_objects:
-                    if "mtime" in file:
-                        if "#text" in file['mtime']:
-                            modified_time.append(file['mtime']['#text'])
-                        else:
-                            modified_time.append(file['mtime'])
-                # Some disk images may have no modified times. Use Siegfried values
-                # and warn in that case.
-                if modified_time == []:
-                    print("  [WARNING] No modified times found in DFXML for files in dataset {}".format(file))
-                    print("            Type N and hit enter at the following prompt to")
-                    print("            skip this dataset, or y to continue processing")
-                    print("            using timestamps from Siegfried.")
-                    user_response = utilities.ask_user("Continue processing this dataset using Siegfried timestamps?")
-                    if user_response == False:
-                        print("  [INFO] Skipping, moving to next dataset...")
-                        continue
-                    else:
-                        print("  [INFO] Continuing, using dates from Siegfried...")
-                else:
-                    end_date = extract_date(max(modified_time))
-                    begin_date = extract_date(min(modified_time))
-
-
-            # Get total file sizes, converting from bytes to megabytes at 2 dec. places
-            total_file_size_bytes = siegfried['filesize'].sum()
-            total_file_size_megabytes = round((total_file_size_bytes / 1048576), 2)
-
-            # Create notes to document the counts of all the file types
-            #     identified in the _format_ file
-            n_formats = formats.shape[0]
-
-            note_detail = []
-            for i in range(n_formats):
-                # String format of Siegfried output may yield NaN for format name.
-                # Check and replace with the phrase unidentified files if needed
-                if pd.isnull(formats['Format'][i]):
-                    note_detail.append(
-                        "Number of unidentified files: " + str(formats['Count'][i]))
-                else:
-                    note_detail.append(
-                        "Number of " + str(formats['Format'][i]) + ": " + str(formats['Count'][i]))
-
-
-            child_archival_object['children'][0]['dates'][0]['begin'] = begin_date.strftime(
-                '%Y-%m-%d')
-            child_archival_object['children'][0]['dates'][0]['end'] = end_date.strftime(
-                '%Y-%m-%d')
-            child_archival_object['children'][0]['dates'][0]['label'] = "modified"
-            child_archival_object['children'][0]['level'] = 'file'
-            child_archival_object['children'][0]['title'] = file_name
-            # child_archival_object['children'][0]['ref_id'] = project_folder.replace(" ", "_") + \
-            #     '_' + file_name.replace(" ", "_")
-            child_archival_object['children'][0]['notes'][0]['content'] = note_detail
-            child_archival_object['children'][0]['notes'][0]['type'] = 'physdesc'
-            child_archival_object['children'][0]['extents'][0]['number'] = str(
-                total_file_size_megabytes)
-            child_archival_object['children'][0]['resource']['ref'] = parent_resource_uri
-
-            if begin_date.strftime('%Y-%m') < end_date.strftime('%Y-%m'):
-                child_archival_object['children'][0]['dates'][0]['expression'] = begin_date.strftime(
-                    '%Y-%m') + '-' + end_date.strftime('%Y-%m')
+            new_uploads.append(result)
+            manifest.record_started(key, run.fingerprints[key])
+        uploads = new_uploads
+
+    # Post this group's children in batches of `batch_size` per
+    #     /children call, with up to the repository's concurrency
+    #     limit of calls in flight
+    children = [result.payload['children'][0] for result in uploads]
+    with metrics.timer('upload'):
+        infos = client.post_children(parent_archival_object_uri, children,
+                                     options.batch_size, run.concurrency)
+
+    # The /children response does not give the URIs of the new records,
+    #     so those the manifest records are looked up by ref_id. A POST
+    #     whose response was lost (a read timeout or a server error) is
+    #     not retried, as the children may have been saved anyway; their
+    #     ref_ids show whether they were.
+    uncertain = [isinstance(info, ArchivesSpaceError) and info.uncertain for info in infos]
+    lookups = [child['ref_id'] for child, info, unsure in zip(children, infos, uncertain)
+               if unsure or (manifest is not None and not isinstance(info, ArchivesSpaceError))]
+    child_uris = {}
+    if lookups:
+        try:
+            child_uris = get_child_uris_by_ref_id(run.repository_uri, lookups, client)
+        except ArchivesSpaceError as e:
+            print("  [WARNING] Could not look up the children saved under {}: {}".format(
+                parent_archival_object_uri, e))
+    infos = [child_uris.get(child['ref_id'], info) if unsure else info
+             for child, info, unsure in zip(children, infos, uncertain)]
+
+    for result, info in zip(uploads, infos):
+        if isinstance(info, ArchivesSpaceError):
+            print("  [ERROR] Could not upload {}: {}: {}".format(
+                result.file_name, info, info.body))
+            metrics.increment('children_failed')
+            run.counts['failed'] += 1
+        elif isinstance(client, ExportClient):
+            print("  [STATUS] Would upload {} to {}".format(
+                result.file_name, parent_archival_object_uri))
+            metrics.increment('children_dry_run')
+            run.counts['prepared'] += 1
+        else:
+            print("  [STATUS] Uploaded {} to {}".format(
+                result.file_name, parent_archival_object_uri))
+            metrics.increment('children_uploaded')
+            run.counts['uploaded'] += 1
+
+    if manifest is not None:
+        for result, child, info in zip(uploads, children, infos):
+            key = dataset_key(project_folder, result.dataset_dir)
+            if isinstance(info, ArchivesSpaceError):
+                manifest.record_failed(key, run.fingerprints[key], info)
             else:
-                child_archival_object['children'][0]['dates'][0]['expression'] = begin_date.strftime(
-                    '%Y')
+                manifest.record_done(key, run.fingerprints[key],
+                                     child_uris.get(child['ref_id']))
+
+    for result, uri in updates:
+        key = dataset_key(project_folder, result.dataset_dir)
+        manifest.record_started(key, run.fingerprints[key])
+        try:
+            with metrics.timer('update'):
+                update_archival_object(uri, result.payload['children'][0], client)
+        except ArchivesSpaceError as e:
+            print("  [ERROR] Could not update {} for {}: {}: {}".format(
+                uri, result.file_name, e, e.body))
+            manifest.record_failed(key, run.fingerprints[key], e)
+            metrics.increment('children_failed')
+            run.counts['failed'] += 1
+            continue
+        print("  [STATUS] Updated {} for {}".format(uri, result.file_name))
+        metrics.increment('children_updated')
+        run.counts['updated'] += 1
+        manifest.record_done(key, run.fingerprints[key], uri)
+
+    # A cached parent that has since been deleted from the backend
+    if cache is not None and any(isinstance(info, ArchivesSpaceError) and
+                                 info.status == 404 for info in infos):
+        print("  [WARNING] Parent {} was not found; dropping it from the lookup cache."
+              " Re-run to create it.".format(parent_archival_object_uri))
+        cache.invalidate_archival_object(run.repository_uri, project_folder.replace(" ", '_'))
+
+
+def prompts_possible(options):
+    """
+    Returns:
+        type: True if reviewing a dataset may stop to ask the user whether
+            to fall back on Siegfried timestamps
+    """
+    return not options.assume_yes and 'ask' in (options.on_missing_dfxml,
+                                                options.on_missing_mtimes)
 
-            child_archival_object_api = parent_archival_object_uri + '/children'
 
-            info = call_archivesspace_api(
-                host, session_id, 'post', child_archival_object_api, child_archival_object)
-            print('  [STATUS] Processing result for ' + file_name + ":")
-            print(info)
+def run_sessions(dir_paths, options, file_credentials=None, inventories=None, metrics=None):
+    """
+    Extract the metadata of every dataset under one or more repository
+    directories and upload it to ArchivesSpace
 
+    All repositories share one logged-in client and lookup cache. Datasets
+    are extracted by a pool of worker processes and uploaded by
+    --parallel-repositories threads as they come out, at most --queue-size
+    datasets ahead of the uploads; each repository has at most its
+    --repository-concurrency limit of requests in flight. On Ctrl-C, the
+    uploads under way are finished and recorded in the run manifest, so
+    that the next run resumes where this one stopped.
+
+    Args:
+        dir_paths (array): paths of the local repository directories
+        options (Namespace): parsed command line options (see build_parser)
+        file_credentials (dict): credentials read from a configuration file
+        inventories (dict): scans of the directories, by path, if already made
+        metrics (Metrics): collector of stage timings and counts
+    """
+    if metrics is None:
+        metrics = Metrics()
+    inventories = inventories or {}
+    try:
+        payloads.load_templates()
+        limits = parse_repository_limits(options.repository_concurrency)
+    except (payloads.TemplateError, ValueError) as e:
+        print("  [ABORT] {}".format(e))
+        exit(1)
+    runs = [RepositoryRun(dir_path, inventories.get(dir_path),
+                          limits.get(os.path.basename(dir_path), options.concurrency))
+            for dir_path in dir_paths]
+
+    if options.dry_run or options.export:
+        # Nothing is sent: payloads are written to the export file (if any)
+        #     and placeholder URIs stand in for the records to be created.
+        export_path = None
+        if options.export:
+            if not os.path.isdir(options.export):
+                os.makedirs(options.export)
+            export_name = runs[0].name if len(runs) == 1 else 'repositories'
+            export_path = os.path.join(options.export, export_name + '.jsonl')
+        client = ExportClient(export_path, [run.name for run in runs])
+        host = client.host
+        options.no_cache = True
+        options.no_manifest = True
+        print("  [INFO] Dry run: nothing will be sent to ArchivesSpace")
+    else:
+        client, host = connect(options, file_credentials, metrics)
+
+    cache = None
+    if not options.no_cache:
+        cache = lookup_cache.LookupCache(options.cache_file, host, options.cache_ttl)
+
+    missing = []
+    for run in runs:
+        if not prepare_repository(run, options, client, cache, metrics):
+            if len(runs) == 1:
+                print("  [ERROR] The repository {} does not exist in this ArchivesSpace instance. Exiting.".format(run.name))
+                exit(1)
+            print("  [ERROR] The repository {} does not exist in this ArchivesSpace instance. Skipping it.".format(run.name))
+            missing.append(run)
+    runs = [run for run in runs if run not in missing]
+
+    # When a fallback may need to be asked about, every dataset is
+    #     reviewed before anything is uploaded, as the prompts would
+    #     otherwise be lost among the upload messages.
+    hold_uploads = prompts_possible(options)
+    max_pending = None
+    if not hold_uploads:
+        max_pending = max(2, options.queue_size or 4 * max(1, options.workers))
+
+    image_engine = options.image_engine if options.from_image else None
+    with metrics.timer('rollup'):
+        for run in runs:
+            # Project rollups start from the summaries of the datasets
+            #     uploaded by earlier runs; the datasets extracted below are
+            #     added as they are reviewed.
+            project_folders = run.project_folders()
+            run.rollups = build_rollups(project_folders,
+                                        dict((project_folder, []) for project_folder in project_folders),
+                                        run.unchanged, not options.no_summary_cache,
+                                        image_engine)
+            unchanged_counts = collections.Counter(dataset.project for dataset in run.unchanged)
+            run.partial_rollups = set(project_folder for project_folder, count in unchanged_counts.items()
+                                      if run.rollups[project_folder].dataset_count < count)
+            run.pending = dict((project_folder, []) for project_folder in project_folders)
+            run.remaining = dict((project_folder, 0) for project_folder in project_folders)
+            for dataset in run.jobs:
+                run.remaining[dataset.project] += 1
+            # Groups of a project whose parent records exist are flushed
+            #     every `batch_size` x concurrency datasets, but never hold
+            #     more than half the queue, so extraction can always go on.
+            run.group_size = max_pending // 2 if max_pending else None
+            if options.batch_size > 0:
+                group_size = options.batch_size * run.concurrency
+                run.group_size = min(group_size, run.group_size or group_size)
+            run.prefix_metrics = len(runs) > 1
+
+    # Extraction, review and upload overlap: while one group of datasets
+    #     is uploaded, the next ones are read by the worker processes.
+    jobs = [(run, dataset) for run in runs for dataset in run.jobs]
+    print("  [INFO] Extracting and uploading {} datasets in {} repositories using {} worker(s)".format(
+        len(jobs), len(runs), options.workers))
+    progress = Progress(len(jobs))
+    pipeline = Pipeline(
+        functools.partial(extract.extract_dataset,
+                          use_summary_cache=not options.no_summary_cache,
+                          image_engine=image_engine,
+                          siegfried_engine=options.siegfried_engine),
+        lambda task: upload_group(task, options, client, cache, metrics, pipeline, progress),
+        options.workers, options.parallel_repositories, max_pending, hold_uploads)
+    try:
+        with metrics.timer('pipeline'), \
+                contextlib.redirect_stdout(LineSynchronizedStream(sys.stdout)):
+            outcome = pipeline.run(
+                jobs, lambda run, result: review_result(run, result, options, pipeline,
+                                                        metrics, progress))
+    except KeyboardInterrupt:
+        print("  [ABORT] Quitting...")
+        exit(130)
+
+    for run in runs:
+        print("  [INFO] Repository {}: {}".format(run.name, run.rollup().describe()))
+    for e in pipeline.failures:
+        print("  [ERROR] {}: {}".format(type(e).__name__, e))
+
+    if cache is not None:
+        cache.close()
+    if isinstance(client, ExportClient):
+        client.close()
+        print("  [INFO] Dry run prepared {} request(s): {}".format(
+            sum(client.counts.values()),
+            ', '.join('{} {}'.format(n, kind) for kind, n in sorted(client.counts.items())) or 'none'))
+        if client.path:
+            print("  [INFO] Payloads written to {}".format(client.path))
+    if len(dir_paths) > 1:
+        report_repositories(runs, missing, isinstance(client, ExportClient))
+    report_metrics(metrics, options)
+
+    if outcome != COMPLETED:
+        handled = sum(run.counts[outcome] for run in runs
+                      for outcome in ('uploaded', 'updated', 'prepared', 'failed'))
+        print("  [ABORT] Stopped after {} of {} datasets were uploaded or updated.".format(
+            handled, len(jobs)))
+        if not options.no_manifest:
+            print("          Finished uploads are recorded in the run manifest;"
+                  " run again to resume.")
+        exit(130 if outcome == INTERRUPTED else 1)
     print('  Completed!')
 
 
-if __name__=="__main__":
+def run_session(dir_path, options, file_credentials=None, inventory=None, metrics=None):
+    """
+    Extract the metadata of every dataset under a repository directory and
+    upload it to ArchivesSpace
+
+    Args:
+        dir_path (string): path of the local repository directory
+        options (Namespace): parsed command line options (see build_parser)
+        file_credentials (dict): credentials read from a configuration file
+        inventory (RepositoryInventory): scan of dir_path, if already made
+        metrics (Metrics): collector of stage timings and counts
+    """
+    run_sessions([dir_path], options, file_credentials, {dir_path: inventory}, metrics)
+
+
+def report_repositories(runs, missing=(), dry_run=False):
+    """
+    Print the dataset outcomes of every repository of a session
+    """
+    outcomes = DRY_RUN_OUTCOMES if dry_run else REPOSITORY_OUTCOMES
+    print("  [INFO] Summary by repository:")
+    for run in runs:
+        print("  [INFO] - {}: {}".format(run.name, ', '.join(
+            '{} {}'.format(run.counts[outcome], outcome) for outcome in outcomes)))
+    for run in missing:
+        print("  [INFO] - {}: not found in ArchivesSpace".format(run.name))
+
+
+def report_metrics(metrics, options):
+    """
+    Print the metrics summary, and write the metrics to --metrics if given
+    """
+    metrics.record_memory()
+    for line in metrics.summary():
+        print(line)
+    if options.metrics:
+        metrics.write(options.metrics)
+        print("  [INFO] Metrics written to {}".format(options.metrics))
+
+
+def fetch_children(results, parents, manifest, client, concurrency=4):
+    """
+    Fetch the ArchivesSpace records of the child archival objects of many
+    datasets of one repository, in bulk
+
+    Children whose URI the run manifest records are fetched by id, a page
+    of them per request; the parents of any other dataset (or of one whose
+    recorded child no longer exists) have all their children listed.
+    Requests run up to concurrency at a time.
+
+    Args:
+        results (array): DatasetResult objects of the repository
+        parents (dict): (parent archival object URI, parent resource URI)
+            by project ref_id, as returned by get_archival_objects
+        manifest (RunManifest): run manifest of the repository, or None
+        client (ArchivesSpaceClient): logged-in ArchivesSpace client
+        concurrency (int): maximum number of simultaneous requests
+
+    Returns:
+        type: (dict mapping (project folder, title) to child records,
+            dict mapping parent URIs whose children could not be listed
+            to their ArchivesSpaceError)
+    """
+    found = {}
+    recorded = {}
+    if manifest is not None:
+        for result in results:
+            uri = manifest.uri(dataset_key(result.project_folder, result.dataset_dir))
+            if uri:
+                recorded[uri] = result
+    records = client.get_records(sorted(recorded), concurrency=concurrency) if recorded else {}
+    for uri, result in recorded.items():
+        record = records.get(uri)
+        if isinstance(record, dict):
+            found[(result.project_folder, result.file_name)] = record
+
+    listed = sorted(set(
+        parents[result.project_folder.replace(" ", '_')][0] for result in results
+        if (result.project_folder, result.file_name) not in found and
+        parents.get(result.project_folder.replace(" ", '_'), ('', ''))[0] != ''))
+    listing_errors = {}
+    infos = client.run_concurrently(
+        [('get', parent_uri + '/children', None) for parent_uri in listed], concurrency)
+    project_folders = dict((parents[result.project_folder.replace(" ", '_')][0], result.project_folder)
+                           for result in results
+                           if result.project_folder.replace(" ", '_') in parents)
+    for parent_uri, children in zip(listed, infos):
+        if isinstance(children, ArchivesSpaceError):
+            listing_errors[parent_uri] = children
+            continue
+        for child in children:
+            found.setdefault((project_folders[parent_uri], child.get('title')), child)
+    return found, listing_errors
+
+
+def verify_repository(run, results, options, client, cache, metrics, reconciliation):
+    """
+    Compare the child archival objects of every dataset of a repository
+    with the records ArchivesSpace holds, adding their outcomes to the
+    reconciliation report
+    """
+    repository = reconciliation.add_repository(run.name, run.repository_uri)
+    ref_ids = sorted(set(result.project_folder.replace(" ", '_') for result in results))
+    with metrics.timer('parent_lookup'):
+        parents = get_archival_objects(ref_ids, run.repository_uri, client, cache) if ref_ids else {}
+    with metrics.timer('fetch'):
+        found, listing_errors = fetch_children(results, parents, run.manifest, client,
+                                               run.concurrency)
+
+    for result in results:
+        project_folder = result.project_folder
+        parent_uri = parents.get(project_folder.replace(" ", '_'), ('', ''))[0]
+
+        def add(status, uri=None, differences=(), detail=None):
+            reconciliation.add_dataset(repository, project_folder, result.dataset_dir,
+                                       result.file_name, status, uri, differences, detail)
+            if status in verify.DISCREPANCIES:
+                print("  [WARNING] {}/{}/{}: {}{}".format(
+                    run.name, project_folder, result.dataset_dir, status,
+                    ' (' + detail + ')' if detail else ''))
+
+        if result.error is not None:
+            add(verify.ERROR, detail=result.error)
+            continue
+        if result.payload is None:
+            add(verify.SKIPPED, detail='no valid timestamps')
+            continue
+        if result.needs_fallback():
+            policy = options.on_missing_dfxml if result.dfxml_missing else options.on_missing_mtimes
+            if policy == 'skip':
+                add(verify.SKIPPED, detail='no DFXML timestamps')
+                continue
+        record = found.get((project_folder, result.file_name))
+        if record is not None:
+            differences = verify.compare_child(result.payload['children'][0], record)
+            add(verify.MISMATCH if differences else verify.MATCH, record.get('uri'), differences,
+                ', '.join(difference['field'] for difference in differences) + ' differ'
+                if differences else None)
+        elif parent_uri == '':
+            add(verify.NO_PARENT)
+        elif parent_uri in listing_errors:
+            add(verify.ERROR, detail=str(listing_errors[parent_uri]))
+        else:
+            add(verify.MISSING)
+
+    counts = repository['counts']
+    print("  [INFO] Verified {}: {}".format(run.name, ', '.join(
+        '{} {}'.format(counts[outcome], outcome) for outcome in verify.OUTCOMES)))
+
+
+def run_verify(dir_paths, options, file_credentials=None, inventories=None, metrics=None):
+    """
+    Compare what ArchivesSpace holds with the child archival objects the
+    datasets under one or more repository directories would be uploaded
+    as, and write a reconciliation report
+
+    Datasets are summarized as for an upload (using their cached
+    summaries when unchanged) and the children of each repository are
+    fetched in bulk, so that the check can run routinely over every
+    repository. Datasets needing a Siegfried fallback are compared using
+    Siegfried dates unless the fallback policy is skip; nothing is asked.
+
+    Args:
+        dir_paths (array): paths of the local repository directories
+        options (Namespace): parsed command line options (see build_parser)
+        file_credentials (dict): credentials read from a configuration file
+        inventories (dict): scans of the directories, by path, if already made
+        metrics (Metrics): collector of stage timings and counts
+    """
+    if metrics is None:
+        metrics = Metrics()
+    inventories = inventories or {}
+    try:
+        payloads.load_templates()
+        limits = parse_repository_limits(options.repository_concurrency)
+    except (payloads.TemplateError, ValueError) as e:
+        print("  [ABORT] {}".format(e))
+        exit(1)
+    runs = [RepositoryRun(dir_path, inventories.get(dir_path),
+                          limits.get(os.path.basename(dir_path), options.concurrency))
+            for dir_path in dir_paths]
+
+    client, host = connect(options, file_credentials, metrics)
+    cache = None
+    if not options.no_cache:
+        cache = lookup_cache.LookupCache(options.cache_file, host, options.cache_ttl)
+    reconciliation = verify.Reconciliation(host)
+
+    found = []
+    for run in runs:
+        run.repository_uri = get_repository_uri(run.name, client, cache)
+        if run.repository_uri == '':
+            print("  [ERROR] The repository {} does not exist in this ArchivesSpace instance.".format(run.name))
+            reconciliation.add_repository(run.name, None)
+            continue
+        if not options.no_manifest:
+            run.manifest = RunManifest(run.dir_path, options.hash_inputs, client.host)
+        if run.inventory is None:
+            with metrics.timer('scan'):
+                run.inventory = scanner.scan_repository(run.dir_path, options.workers)
+        run.jobs = list(run.inventory.datasets())
+        found.append(run)
+
+    jobs = [dataset for run in found for dataset in run.jobs]
+    print("  [INFO] Verifying {} datasets in {} repositories".format(len(jobs), len(found)))
+    image_engine = options.image_engine if options.from_image else None
+    with metrics.timer('extract'):
+        results = extract.extract_datasets(jobs, options.workers,
+                                           not options.no_summary_cache, image_engine,
+                                           options.siegfried_engine)
+    position = 0
+    for run in found:
+        run_results = results[position:position + len(run.jobs)]
+        position += len(run.jobs)
+        for result in run_results:
+            key = dataset_key(result.project_folder, result.dataset_dir)
+            metrics.add_dataset(run.name + '/' + key if len(found) > 1 else key, result.metrics)
+        verify_repository(run, run_results, options, client, cache, metrics, reconciliation)
+
+    if cache is not None:
+        cache.close()
+    counts = reconciliation.counts()
+    print("  [INFO] Verification: {}".format(', '.join(
+        '{} {}'.format(counts[outcome], outcome) for outcome in verify.OUTCOMES)))
+    if options.verify_report:
+        reconciliation.write(options.verify_report)
+        print("  [INFO] Reconciliation report written to {}".format(options.verify_report))
+    report_metrics(metrics, options)
+    if reconciliation.discrepancies():
+        print("  [WARNING] {} discrepancies found.".format(reconciliation.discrepancies()))
+        exit(1)
+    print('  Completed!')
 
+
+def run_replay(export_path, options, file_credentials=None):
+    """
+    Send the payloads of an export file written by --export to ArchivesSpace
+
+    Args:
+        export_path (string): JSON Lines file written by --export
+        options (Namespace): parsed command line options (see build_parser)
+        file_credentials (dict): credentials read from a configuration file
+    """
+    metrics = Metrics()
+    client, host = connect(options, file_credentials, metrics)
+    try:
+        with metrics.timer('replay'):
+            sent, failures = replay_export(client, export_path)
+    except ValueError as e:
+        print("  [ERROR] {}. Exiting.".format(e))
+        exit(1)
+    print("  [INFO] Sent {} request(s) from {}".format(sent, export_path))
+    for api, error in failures:
+        print("  [ERROR] {}: {}".format(api, error))
+    report_metrics(metrics, options)
+    print('  Completed!')
+
+
+def build_parser():
+    """
+    Build the command line parser for bc_to_as.py
+
+    Returns:
+        type: ArgumentParser
+    """
     parser = ArgumentParser(prog='bc_to_as.py', description='Import Brunnhilde-generated metadata into ArchivesSpace')
-    parser.add_argument('repodir', action='store', help="Top level local directory corresponding to the remote repository structure")
-    args = parser.parse_args()
+    parser.add_argument('repodir', action='store', nargs='*', help="Top level local directories corresponding to remote repository structures; glob patterns such as '/data/*' are expanded")
+    parser.add_argument('--config', help="INI file with ArchivesSpace credentials ([archivesspace] section) and defaults for these options ([bc_to_as] section)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help="Number of worker processes used to extract dataset metadata (default: number of CPUs)")
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help="Maximum number of simultaneous uploads to ArchivesSpace (default: 4)")
+    parser.add_argument('--repository-concurrency', action='append', metavar='REPOSITORY=N', help="Maximum number of simultaneous uploads to one repository, overriding --concurrency; may be repeated")
+    parser.add_argument('--parallel-repositories', type=int, default=1, help="Number of upload threads; each uploads one repository at a time (default: 1)")
+    parser.add_argument('--queue-size', type=int, metavar='N', help="Maximum number of datasets extracted ahead of their upload (default: 4 per worker)")
+    parser.add_argument('-b', '--batch-size', type=int, default=1, help="Number of child archival objects sent per request; 0 sends as many datasets of a project as the queue holds in one request (default: 1)")
+    parser.add_argument('--cache-file', default=lookup_cache.default_cache_path(), help="SQLite file caching repository and archival object lookups (default: %(default)s)")
+    parser.add_argument('--cache-ttl', type=float, default=lookup_cache.DEFAULT_TTL, help="Seconds before a cached lookup is refreshed from ArchivesSpace (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true', help="Do not read or write the lookup cache")
+    parser.add_argument('--no-manifest', action='store_true', help="Upload every dataset, ignoring and not updating the run manifest in the repository directory")
+    parser.add_argument('--no-summary-cache', action='store_true', help="Always re-read the Brunnhilde output, rather than loading the summary cached in each dataset directory")
+    parser.add_argument('--siegfried-engine', choices=siegfried.ENGINES, default='auto', help="How siegfried.csv is parsed: memory-mapped with numpy, with pandas, with the csv module, or the fastest available (default: auto)")
+    parser.add_argument('--from-image', action='store_true', help="Read file counts, sizes and modified times directly from a disk image (.E01, .raw, .dd, .img, .aff, .iso) in each dataset directory instead of from dfxml.xml")
+    parser.add_argument('--image-engine', choices=disk_image.ENGINES, default='auto', help="How --from-image reads images: the Sleuth Kit bindings (pytsk3, with pyewf for E01), fiwalk, or whichever is available (default: auto)")
+    parser.add_argument('--hash-inputs', action='store_true', help="Detect changed datasets by content hash as well as file size and modification time; disk images read with --from-image are compared by size and modification time only")
+    parser.add_argument('-y', '--assume-yes', action='store_true', help="Answer yes to every confirmation prompt")
+    parser.add_argument('--non-interactive', action='store_true', help="Never prompt; implies --assume-yes. Credentials must come from the environment or --config")
+    parser.add_argument('--on-missing-dfxml', choices=config.FALLBACK_POLICIES, default='ask', help="What to do with datasets that have no dfxml.xml: ask, use Siegfried timestamps, or skip them (default: ask)")
+    parser.add_argument('--on-missing-mtimes', choices=config.FALLBACK_POLICIES, default='ask', help="What to do with datasets whose dfxml.xml has no modified times (default: ask)")
+    parser.add_argument('--metrics', metavar='FILE', help="Write stage timings, request counts and latencies to FILE: a Prometheus textfile if FILE ends in .prom, JSON otherwise")
+    parser.add_argument('--dry-run', action='store_true', help="Extract and build every payload, but send nothing to ArchivesSpace")
+    parser.add_argument('--export', metavar='DIR', help="Like --dry-run, and write the payloads to DIR/<repository>.jsonl (DIR/repositories.jsonl for several repositories) for review or --replay")
+    parser.add_argument('--replay', metavar='FILE', help="Send the payloads of a file written by --export to ArchivesSpace (no repodir needed)")
+    parser.add_argument('--verify', action='store_true', help="Upload nothing; compare the dates, extents and notes in ArchivesSpace with those the datasets would be uploaded with, and exit with status 1 if any differ or are missing")
+    parser.add_argument('--verify-report', metavar='FILE', help="With --verify, write the outcome of every dataset, with its differences, to FILE as JSON")
+    return parser
+
+
+def parse_options(argv=None):
+    """
+    Parse the command line, taking defaults from --config if given
 
-    if os.path.isdir(args.repodir):
-       repo_dir = (args.repodir).rstrip("/")
+    Returns:
+        type: (options Namespace, credentials dict from the config file)
+    """
+    parser = build_parser()
+    options = parser.parse_args(argv)
+    file_credentials = {}
+    if options.config:
+        try:
+            file_credentials, file_options = config.read_config_file(options.config)
+            parser.set_defaults(**config.option_defaults(parser, file_options))
+        except config.ConfigError as e:
+            parser.error(str(e))
+        options = parser.parse_args(argv)
+    if not options.repodir and not options.replay:
+        parser.error("the following arguments are required: repodir")
+    if options.verify and (options.dry_run or options.export or options.replay):
+        parser.error("--verify cannot be combined with --dry-run, --export or --replay")
+    if options.verify_report and not options.verify:
+        parser.error("--verify-report needs --verify")
+    try:
+        parse_repository_limits(options.repository_concurrency)
+    except ValueError as e:
+        parser.error(str(e))
+    if options.non_interactive:
+        options.assume_yes = True
+    return options, file_credentials
 
-       # Check the structure of the local directory.
-       utilities.check_repo_structure(repo_dir)
 
-       # Proceed and connect to backend.
-       run_session(repo_dir)
+if __name__=="__main__":
+
+    args, file_credentials = parse_options()
+
+    if args.replay:
+       run_replay(args.replay, args, file_credentials)
 
     else:
-       print("  [ABORT] The directory {} does not exist. You must use the full path to the local directory corresponding to the repository structure. Check the path and directory name and try again.".format(args.repodir))
+       repo_dirs = expand_repository_dirs(args.repodir)
+
+       # Check the structure of each local directory.
+       metrics = Metrics()
+       inventories = {}
+       for repo_dir in repo_dirs:
+           with metrics.timer('scan'):
+               inventories[repo_dir] = scanner.scan_repository(repo_dir, args.workers)
+           utilities.check_repo_structure(repo_dir, args.assume_yes, inventories[repo_dir],
+                                          args.from_image)
+
+       # Proceed and connect to backend.
+       if args.verify:
+           run_verify(repo_dirs, args, file_credentials, inventories, metrics)
+       else:
+           run_sessions(repo_dirs, args, file_credentials, inventories, metrics)
@@ -0,0 +1,387 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# client.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# ArchivesSpace API client used by bc_to_as.py. Requests share a pooled
+# HTTP session, are retried with backoff on server errors and timeouts,
+# and transparently log in again when the backend session expires. POSTs
+# are only retried when they never reached the backend, so that a lost
+# response cannot create a record twice.
+#
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from bc_to_aspace_toolkit import payloads
+
+# Error codes returned by the backend when the session id is no longer valid
+SESSION_ERROR_CODES = ('SESSION_GONE', 'SESSION_EXPIRED')
+
+# Records fetched per id_set[] request; the backend refuses more than
+# its maximum page size (250 by default)
+ID_SET_PAGE_SIZE = 100
+
+# Methods that can be sent again without changing the outcome
+IDEMPOTENT_METHODS = ('get', 'head', 'put', 'delete', 'options')
+
+
+class ArchivesSpaceError(Exception):
+    """
+    Raised when the ArchivesSpace backend rejects a request
+
+    Attributes:
+        status (int): HTTP status code (None if no response was received)
+        body: decoded JSON error body, or the raw response text
+        uncertain (bool): the request reached the backend but no answer
+            came back (a read timeout or a server error), so it may have
+            been carried out all the same
+    """
+
+    def __init__(self, message, status=None, body=None, uncertain=False):
+        super(ArchivesSpaceError, self).__init__(message)
+        self.status = status
+        self.body = body
+        self.uncertain = uncertain
+
+
+class ArchivesSpaceClient(object):
+    """
+    Pooled, retrying client for the ArchivesSpace backend API
+
+    Args:
+        host (string): API URL
+        username (string): username of your ArchivesSpace account
+        password (string): password of your ArchivesSpace account
+        timeout (float): seconds to wait for each response
+        retries (int): attempts made after the first on 5xx responses,
+            timeouts and connection errors; POSTs are only retried if the
+            connection could not be made
+        backoff (float): base delay in seconds, doubled on each retry
+        pool_size (int): maximum number of pooled connections
+        metrics (Metrics): optional collector of request counts and latencies
+    """
+
+    def __init__(self, host, username, password, timeout=60, retries=3,
+                 backoff=0.5, pool_size=10, metrics=None):
+        self.host = host.rstrip('/')
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.session_id = None
+        self.metrics = metrics
+
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+        self._login_lock = threading.Lock()
+
+    def login(self):
+        """
+        Get a new session id from the ArchivesSpace backend
+
+        Returns:
+            type: session id (string)
+
+        Raises:
+            ArchivesSpaceError: the credentials or URL were rejected
+        """
+        url = self.host + '/users/' + self.username + '/login'
+        try:
+            response = self.http.post(url, params={'password': self.password},
+                                      timeout=self.timeout)
+            authentication = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ArchivesSpaceError("Login failed: {}".format(e))
+        if response.status_code != 200 or 'session' not in authentication:
+            raise ArchivesSpaceError("Login failed", response.status_code,
+                                     authentication)
+
+        self.session_id = authentication['session']
+        self.http.headers['X-ArchivesSpace-Session'] = self.session_id
+        return self.session_id
+
+    def _relogin(self, stale_session_id):
+        # Several threads may notice the expiry at once; only the first
+        # one needs to log in again.
+        with self._login_lock:
+            if self.session_id == stale_session_id:
+                self.login()
+
+    def request(self, method, api, data=None, params=None):
+        """
+        Call the ArchivesSpace API
+
+        Args:
+            method (string): HTTP method ("get" or "post")
+            api (string): API path, e.g. "/repositories"
+            data: JSON-serializable request body
+            params (dict): query string parameters
+
+        Returns:
+            type: decoded JSON response
+
+        Raises:
+            ArchivesSpaceError: the request failed after all retries, or
+                was rejected by the backend; for a POST whose response was
+                lost the error is marked uncertain and not retried
+        """
+        url = self.host + api
+        body = payloads.dumps(data) if data is not None else None
+        idempotent = method.lower() in IDEMPOTENT_METHODS
+        relogged = False
+        attempt = 0
+
+        while True:
+            session_id = self.session_id
+            start = time.perf_counter()
+            try:
+                response = self.http.request(method.upper(), url, data=body,
+                                             params=params, timeout=self.timeout)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                self._record(method, start, None, body)
+                unsent = _not_sent(e)
+                if attempt < self.retries and (idempotent or unsent):
+                    self._sleep(attempt)
+                    attempt += 1
+                    continue
+                raise ArchivesSpaceError("{} {} failed: {}".format(
+                    method.upper(), api, e), uncertain=not unsent)
+            self._record(method, start, response, body)
+
+            if response.status_code >= 500 and idempotent and attempt < self.retries:
+                self._sleep(attempt)
+                attempt += 1
+                continue
+
+            try:
+                result = response.json()
+            except ValueError:
+                result = response.text
+
+            if response.status_code >= 400:
+                code = result.get('code') if isinstance(result, dict) else None
+                if code in SESSION_ERROR_CODES and not relogged:
+                    self._relogin(session_id)
+                    relogged = True
+                    if self.metrics is not None:
+                        self.metrics.increment('http_relogins')
+                    continue
+                raise ArchivesSpaceError("{} {} returned HTTP {}".format(
+                    method.upper(), api, response.status_code),
+                    response.status_code, result,
+                    uncertain=response.status_code >= 500)
+            return result
+
+    def _record(self, method, start, response, body):
+        if self.metrics is None:
+            return
+        seconds = time.perf_counter() - start
+        self.metrics.observe('http_latency_seconds', seconds)
+        self.metrics.add_time('http', seconds)
+        self.metrics.increment('http_requests_' + method.lower())
+        if body is not None:
+            self.metrics.increment('http_bytes_sent', len(body))
+        if response is None:
+            self.metrics.increment('http_connection_errors')
+        else:
+            self.metrics.increment('http_bytes_received', len(response.content))
+            if response.status_code >= 400:
+                self.metrics.increment('http_errors')
+
+    def _sleep(self, attempt):
+        if self.metrics is not None:
+            self.metrics.increment('http_retries')
+        time.sleep(self.backoff * (2 ** attempt))
+
+    def get(self, api, params=None):
+        return self.request('get', api, params=params)
+
+    def post(self, api, data=None, params=None):
+        return self.request('post', api, data=data, params=params)
+
+    def run_concurrently(self, calls, concurrency=4):
+        """
+        Run many API calls on an asyncio event loop, at most concurrency
+        of them in flight at once
+
+        Args:
+            calls (array): (method, api, data) tuples
+            concurrency (int): maximum number of simultaneous requests
+
+        Returns:
+            type: results in the same order as calls (array); failed calls
+                are returned as their ArchivesSpaceError
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self._gather(calls, concurrency))
+        finally:
+            loop.close()
+
+    async def _gather(self, calls, concurrency):
+        concurrency = max(1, min(concurrency, self.pool_size))
+        semaphore = asyncio.Semaphore(concurrency)
+        loop = asyncio.get_event_loop()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            async def run(method, api, data):
+                async with semaphore:
+                    try:
+                        return await loop.run_in_executor(
+                            executor, self.request, method, api, data)
+                    except ArchivesSpaceError as e:
+                        return e
+
+            return await asyncio.gather(
+                *[run(method, api, data) for method, api, data in calls])
+
+    def get_records(self, uris, page_size=ID_SET_PAGE_SIZE, concurrency=4):
+        """
+        Fetch many records in bulk
+
+        URIs are grouped by repository and record type, and each group is
+        fetched in pages of page_size records with id_set[] requests, run
+        concurrently.
+
+        Args:
+            uris (array): record URIs, e.g. /repositories/2/archival_objects/7
+            page_size (int): records per request
+            concurrency (int): maximum number of simultaneous requests
+
+        Returns:
+            type: dict mapping URIs to records; records that no longer
+                exist are left out, and those of a failed request map to
+                its ArchivesSpaceError
+        """
+        groups = {}
+        for uri in uris:
+            collection, record_id = uri.rsplit('/', 1)
+            groups.setdefault(collection, []).append(record_id)
+        pages = [(collection, ids[start:start + page_size])
+                 for collection, ids in sorted(groups.items())
+                 for start in range(0, len(ids), page_size)]
+
+        records = {}
+        infos = self.run_concurrently(
+            [('get', collection + '?' + urlencode([('id_set[]', record_id) for record_id in ids]), None)
+             for collection, ids in pages], concurrency)
+        for (collection, ids), info in zip(pages, infos):
+            if isinstance(info, ArchivesSpaceError):
+                for record_id in ids:
+                    records[collection + '/' + record_id] = info
+                continue
+            for record in info:
+                records[record['uri']] = record
+        return records
+
+    def post_children(self, parent_uri, children, batch_size=1, concurrency=4):
+        """
+        Add child archival objects to a parent in as few /children calls
+        as possible
+
+        Batches are posted concurrently. The backend saves a batch in a
+        single transaction, so when one is rejected the entries named in
+        its error response are set aside and the rest are posted again; if
+        the error does not name an entry the batch is split in half until
+        the failing entries are isolated. A batch whose outcome is
+        uncertain is not posted again, as it may have been saved.
+
+        Args:
+            parent_uri (string): URI of the parent archival object
+            children (array): child archival object records
+            batch_size (int): children per call; 0 posts them all at once
+            concurrency (int): maximum number of simultaneous requests
+
+        Returns:
+            type: one outcome per child, in order (array); the backend
+                response for children that were saved, or the
+                ArchivesSpaceError for those that were not
+        """
+        api = parent_uri + '/children'
+        if batch_size is None or batch_size <= 0:
+            batch_size = max(1, len(children))
+        batches = [list(range(start, min(start + batch_size, len(children))))
+                   for start in range(0, len(children), batch_size)]
+
+        outcomes = [None] * len(children)
+        infos = self.run_concurrently(
+            [('post', api, {'children': [children[i] for i in batch]})
+             for batch in batches], concurrency)
+        for batch, info in zip(batches, infos):
+            if isinstance(info, ArchivesSpaceError) and not info.uncertain and len(batch) > 1:
+                self._retry_batch(api, children, batch, info, outcomes)
+            else:
+                for i in batch:
+                    outcomes[i] = info
+        return outcomes
+
+    def _retry_batch(self, api, children, batch, error, outcomes):
+        failed = _failed_positions(error, len(batch))
+        if failed:
+            for position in failed:
+                outcomes[batch[position]] = error
+            rest = [i for position, i in enumerate(batch) if position not in failed]
+            halves = [rest] if rest else []
+        else:
+            middle = len(batch) // 2
+            halves = [batch[:middle], batch[middle:]]
+
+        for part in halves:
+            try:
+                info = self.post(api, {'children': [children[i] for i in part]})
+            except ArchivesSpaceError as e:
+                if len(part) == 1 or e.uncertain:
+                    for i in part:
+                        outcomes[i] = e
+                else:
+                    self._retry_batch(api, children, part, e, outcomes)
+                continue
+            for i in part:
+                outcomes[i] = info
+
+
+def _not_sent(error):
+    """
+    Tell whether a request failed before any of it reached the backend:
+    the connection timed out or was refused
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
+def _failed_positions(error, batch_length):
+    """
+    Find the batch positions named in a validation error such as
+    {"error": {"children/3/dates/0/begin": ["is required"]}}
+    """
+    body = error.body if isinstance(error.body, dict) else {}
+    details = body.get('error')
+    if not isinstance(details, dict):
+        return set()
+
+    positions = set()
+    for field in details:
+        parts = field.split('/')
+        if len(parts) > 1 and parts[0] == 'children' and parts[1].isdigit():
+            position = int(parts[1])
+            if position < batch_length:
+                positions.add(position)
+    return positions
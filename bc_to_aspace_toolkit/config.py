@@ -0,0 +1,176 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# config.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Configuration for unattended runs of bc_to_as.py: option defaults and
+# ArchivesSpace credentials read from an INI file or the environment.
+#
+# Example configuration file:
+#
+#   [archivesspace]
+#   url = http://aspace.example.org:8089
+#   username = admin
+#   password_file = /home/bcadmin/.aspace_password
+#   created_by = admin
+#
+#   [bc_to_as]
+#   non_interactive = true
+#   on_missing_dfxml = siegfried
+#   workers = 8
+#
+
+import getpass
+import os
+import sys
+
+# Values are read verbatim, so passwords may contain '%'
+try:
+    from configparser import ConfigParser
+    PARSER_ARGS = {'interpolation': None}
+except ImportError:
+    from ConfigParser import RawConfigParser as ConfigParser
+    PARSER_ARGS = {}
+
+CREDENTIALS_SECTION = 'archivesspace'
+OPTIONS_SECTION = 'bc_to_as'
+
+# Environment variables consulted for each credential, in order of
+# precedence over the configuration file
+CREDENTIAL_ENV_VARS = {
+    'url': 'ASPACE_URL',
+    'username': 'ASPACE_USERNAME',
+    'password': 'ASPACE_PASSWORD',
+    'password_file': 'ASPACE_PASSWORD_FILE',
+    'created_by': 'ASPACE_CREATED_BY',
+}
+
+CREDENTIAL_PROMPTS = (
+    ('url', 'ArchivesSpace backend URL: '),
+    ('username', 'Username: '),
+    ('password', 'Password: '),
+    ('created_by', 'Created by: '),
+)
+
+# Choices for --on-missing-dfxml and --on-missing-mtimes
+FALLBACK_POLICIES = ('ask', 'siegfried', 'skip')
+
+
+class ConfigError(Exception):
+    """
+    Raised when the configuration is incomplete or cannot be read
+    """
+
+
+def read_config_file(path):
+    """
+    Read a bc_to_as configuration file
+
+    Args:
+        path (string): path of the INI file
+
+    Returns:
+        type: (credentials dict, options dict); option names use
+            underscores, e.g. "on_missing_dfxml"
+    """
+    parser = ConfigParser(**PARSER_ARGS)
+    if not parser.read(path):
+        raise ConfigError("Could not read configuration file {}".format(path))
+
+    credentials = {}
+    if parser.has_section(CREDENTIALS_SECTION):
+        credentials = dict(parser.items(CREDENTIALS_SECTION))
+    options = {}
+    if parser.has_section(OPTIONS_SECTION):
+        for name, value in parser.items(OPTIONS_SECTION):
+            options[name.replace('-', '_')] = value
+    return credentials, options
+
+
+def option_defaults(arg_parser, options):
+    """
+    Convert option values read from a configuration file into defaults
+    for the command line parser
+
+    Values for flags (options whose default is True or False) are read as
+    booleans; everything else is left to the parser's own type conversion.
+    Defaults are not checked against the choices of an option by argparse,
+    so that is done here.
+
+    Args:
+        arg_parser (ArgumentParser): the command line parser
+        options (dict): option values from read_config_file
+
+    Returns:
+        type: dict suitable for ArgumentParser.set_defaults
+
+    Raises:
+        ConfigError: a value is not one of the choices of its option
+    """
+    choices = dict((action.dest, action.choices) for action in arg_parser._actions
+                   if action.choices is not None)
+    defaults = {}
+    for name, value in options.items():
+        if isinstance(arg_parser.get_default(name), bool):
+            value = value.strip().lower() in ('1', 'yes', 'true', 'on')
+        elif name in choices and value not in choices[name]:
+            raise ConfigError("Invalid value {!r} for {} in the [{}] section of the configuration file (choose from {})".format(
+                value, name, OPTIONS_SECTION, ', '.join(repr(choice) for choice in choices[name])))
+        defaults[name] = value
+    return defaults
+
+
+def get_credentials(file_credentials=None, interactive=True):
+    """
+    Collect the ArchivesSpace URL, username, password and creator name
+
+    Each value is taken from the environment, then the configuration
+    file, and is otherwise asked for on the terminal.
+
+    Args:
+        file_credentials (dict): values from the configuration file
+        interactive (bool): prompt for values that were not supplied
+
+    Returns:
+        type: dict with url, username, password and created_by
+
+    Raises:
+        ConfigError: a value is missing and interactive is False, or the
+            password file cannot be read
+    """
+    file_credentials = file_credentials or {}
+    credentials = {}
+    for name, variable in CREDENTIAL_ENV_VARS.items():
+        value = os.environ.get(variable) or file_credentials.get(name)
+        if value:
+            credentials[name] = value
+
+    if 'password' not in credentials and 'password_file' in credentials:
+        password_file = os.path.expanduser(credentials['password_file'])
+        try:
+            with open(password_file) as f:
+                credentials['password'] = f.read().strip()
+        except (IOError, OSError) as e:
+            raise ConfigError("Could not read password file {}: {}".format(password_file, e))
+    credentials.pop('password_file', None)
+
+    for name, prompt in CREDENTIAL_PROMPTS:
+        if name in credentials:
+            continue
+        if not interactive:
+            if name == 'created_by':
+                credentials[name] = credentials.get('username', '')
+                continue
+            raise ConfigError("No {} given; set {} or add it to the [{}] section of the configuration file".format(
+                name, CREDENTIAL_ENV_VARS[name], CREDENTIALS_SECTION))
+        if name == 'password':
+            credentials[name] = getpass.getpass(prompt=prompt)
+        elif sys.version_info[0] < 3:
+            credentials[name] = raw_input(prompt)
+        else:
+            credentials[name] = input(prompt)
+    return credentials
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# dfxml.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Streaming reader for fiwalk-generated DFXML. Only the fields needed
+# by bc_to_as.py are retained; fileobject elements are discarded as soon
+# as they have been read so memory use does not grow with the input.
+#
+
+import xml.etree.ElementTree as ET
+
+from bc_to_aspace_toolkit import timestamps
+
+# Number of mtime strings buffered before they are parsed as one batch
+MTIME_BATCH_SIZE = 50000
+
+
+class DFXMLSummary(object):
+    """
+    Aggregates collected from the fileobjects in a DFXML document
+
+    Attributes:
+        file_count (int): number of fileobject elements seen
+        total_bytes (int): sum of the filesize values
+        mtimes (TimestampRange): UTC range of the mtime values
+    """
+
+    def __init__(self):
+        self.file_count = 0
+        self.total_bytes = 0
+        self.mtimes = timestamps.TimestampRange()
+
+    def has_mtimes(self):
+        return not self.mtimes.is_empty()
+
+
+def _local_name(tag):
+    """
+    Strip the namespace from an ElementTree tag ('{ns}mtime' -> 'mtime')
+    """
+    if tag[:1] == '{':
+        return tag.rsplit('}', 1)[1]
+    return tag
+
+
+def iter_fileobjects(source):
+    """
+    Stream the fileobjects in a DFXML document
+
+    Works for both the 'dfxml/volume/fileobject' and the bare
+    'dfxml/fileobject' layouts written by fiwalk. Each fileobject is
+    detached from its parent once it has been yielded.
+
+    Args:
+        source (string or file object): path of the dfxml file, or an
+            open binary stream (e.g. the stdout of a fiwalk process)
+
+    Returns:
+        type: generator of dicts mapping child tag names to their text
+    """
+    stack = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if _local_name(elem.tag) != 'fileobject':
+            continue
+
+        fields = {}
+        for child in elem:
+            fields[_local_name(child.tag)] = child.text
+        yield fields
+
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+
+def summarize_dfxml(source):
+    """
+    Collect mtime range, file count and byte total from a DFXML document
+    in a single pass
+
+    Args:
+        source (string or file object): path of the dfxml file or an
+            open binary stream
+
+    Returns:
+        type: DFXMLSummary
+    """
+    summary = DFXMLSummary()
+    mtimes = []
+    for fields in iter_fileobjects(source):
+        summary.file_count += 1
+
+        filesize = fields.get('filesize')
+        if filesize:
+            try:
+                summary.total_bytes += int(filesize)
+            except ValueError:
+                pass
+
+        if 'mtime' in fields:
+            mtimes.append(fields['mtime'])
+            if len(mtimes) >= MTIME_BATCH_SIZE:
+                summary.mtimes.merge(timestamps.timestamp_range(mtimes))
+                mtimes = []
+
+    if mtimes:
+        summary.mtimes.merge(timestamps.timestamp_range(mtimes))
+    return summary
@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# disk_image.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Reads file system metadata straight from a raw or E01 disk image, as an
+# alternative to parsing the dfxml.xml fiwalk would write for it. Only the
+# aggregates bc_to_as.py uses (file count, total size and mtime range) are
+# collected: file contents are never read or hashed and no XML file is
+# written. The Sleuth Kit Python bindings (pytsk3, and pyewf for E01
+# images) are used when installed; otherwise fiwalk is run with its DFXML
+# output streamed straight into the dfxml reader.
+#
+
+import datetime
+import os
+import shutil
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ET
+
+from bc_to_aspace_toolkit import dfxml
+from bc_to_aspace_toolkit import timestamps
+
+try:
+    import pytsk3
+except ImportError:
+    pytsk3 = None
+
+try:
+    import pyewf
+except ImportError:
+    pyewf = None
+
+# Extensions of images in the Expert Witness (EnCase) format
+EWF_EXTENSIONS = ('.e01',)
+
+FIWALK_COMMAND = 'fiwalk'
+
+# Ways of reading an image; 'auto' prefers the Sleuth Kit bindings
+ENGINES = ('auto', 'tsk', 'fiwalk')
+
+
+class DiskImageError(IOError):
+    """
+    Raised when a disk image cannot be read by any available engine
+    """
+
+
+def available_engine():
+    """
+    Returns:
+        type: 'tsk' if pytsk3 is installed, 'fiwalk' if fiwalk is on the
+            PATH, or None
+    """
+    if pytsk3 is not None:
+        return 'tsk'
+    if shutil.which(FIWALK_COMMAND) is not None:
+        return 'fiwalk'
+    return None
+
+
+def summarize_image(image_path, engine='auto'):
+    """
+    Collect the file count, byte total and mtime range of every file
+    system in a disk image, in a single walk of its metadata
+
+    The engines do not cover the same entries. The tsk engine counts what
+    listing each directory down from the root shows. It skips names whose
+    metadata is gone and never visits orphan files, which no directory
+    names. fiwalk also reports deleted and orphan files. So on an image
+    with deleted content the tsk engine finds fewer files and bytes, and
+    possibly a narrower mtime range, than the dfxml.xml fiwalk writes. Use
+    engine='fiwalk' when the figures must agree with fiwalk's.
+
+    Args:
+        image_path (string): path of the raw or E01 image (for split E01
+            images, the first segment)
+        engine (string): 'tsk', 'fiwalk', or 'auto' to use whichever is
+            available
+
+    Returns:
+        type: DFXMLSummary, the same aggregates as summarize_dfxml gives
+            for the dfxml.xml fiwalk would write for the image (with the
+            fiwalk engine; see above for the tsk engine)
+
+    Raises:
+        DiskImageError: the image could not be read
+    """
+    if engine == 'auto':
+        engine = available_engine()
+        if engine is None:
+            raise DiskImageError("Reading {} needs pytsk3 or {} on the PATH".format(
+                image_path, FIWALK_COMMAND))
+    if engine == 'tsk':
+        if pytsk3 is None:
+            raise DiskImageError("Reading {} with the Sleuth Kit needs pytsk3".format(image_path))
+        return _summarize_tsk(image_path)
+    if engine == 'fiwalk':
+        return _summarize_fiwalk(image_path)
+    raise ValueError("Unknown disk image engine {!r}".format(engine))
+
+
+def _summarize_fiwalk(image_path):
+    # -x writes the DFXML to stdout, -z skips the MD5 and SHA1 of every file
+    with tempfile.TemporaryFile() as errors:
+        try:
+            process = subprocess.Popen([FIWALK_COMMAND, '-x', '-z', image_path],
+                                       stdout=subprocess.PIPE, stderr=errors)
+        except OSError as e:
+            raise DiskImageError("Could not run {}: {}".format(FIWALK_COMMAND, e))
+        parse_error = None
+        try:
+            summary = dfxml.summarize_dfxml(process.stdout)
+        except ET.ParseError as e:
+            parse_error = e
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0 or parse_error is not None:
+            errors.seek(0)
+            lines = errors.read().decode('utf-8', 'replace').strip().splitlines()
+            reason = lines[-1] if lines else parse_error or 'exit status {}'.format(returncode)
+            raise DiskImageError("{} failed on {}: {}".format(FIWALK_COMMAND, image_path, reason))
+    return summary
+
+
+if pytsk3 is not None and pyewf is not None:
+    class EWFImgInfo(pytsk3.Img_Info):
+        """
+        Sleuth Kit image backed by a pyewf handle, for E01 images
+        """
+
+        def __init__(self, ewf_handle):
+            self._ewf_handle = ewf_handle
+            super(EWFImgInfo, self).__init__(url='', type=pytsk3.TSK_IMG_TYPE_EXTERNAL)
+
+        def close(self):
+            self._ewf_handle.close()
+
+        def read(self, offset, size):
+            self._ewf_handle.seek(offset)
+            return self._ewf_handle.read(size)
+
+        def get_size(self):
+            return self._ewf_handle.get_media_size()
+
+
+def _open_image(image_path):
+    if os.path.splitext(image_path)[1].lower() in EWF_EXTENSIONS:
+        if pyewf is None:
+            # The Sleuth Kit may have been built with libewf itself
+            return pytsk3.Img_Info(image_path)
+        handle = pyewf.handle()
+        handle.open(pyewf.glob(image_path))
+        return EWFImgInfo(handle)
+    return pytsk3.Img_Info(image_path)
+
+
+def _file_system_offsets(image):
+    """
+    Returns:
+        type: byte offsets of the partitions that may hold a file system,
+            or [0] for an image of a single unpartitioned file system
+    """
+    try:
+        volume = pytsk3.Volume_Info(image)
+    except IOError:
+        return [0]
+    return [partition.start * volume.info.block_size for partition in volume
+            if partition.flags == pytsk3.TSK_VS_PART_FLAG_ALLOC and partition.len > 0]
+
+
+def _summarize_tsk(image_path):
+    try:
+        image = _open_image(image_path)
+    except (IOError, OSError) as e:
+        raise DiskImageError("Could not open {}: {}".format(image_path, e))
+
+    summary = dfxml.DFXMLSummary()
+    low = high = None
+    count = 0
+    for offset in _file_system_offsets(image):
+        try:
+            file_system = pytsk3.FS_Info(image, offset=offset)
+        except IOError:
+            # Partitions without a file system the Sleuth Kit knows
+            continue
+        visited = set()
+        directories = [file_system.open_dir(path='/')]
+        while directories:
+            directory = directories.pop()
+            for entry in directory:
+                name = entry.info.name.name
+                meta = entry.info.meta
+                if name in (b'.', b'..') or meta is None:
+                    continue
+                summary.file_count += 1
+                summary.total_bytes += meta.size
+                if meta.mtime:
+                    count += 1
+                    if low is None or meta.mtime < low:
+                        low = meta.mtime
+                    if high is None or meta.mtime > high:
+                        high = meta.mtime
+                if meta.type == pytsk3.TSK_FS_META_TYPE_DIR and meta.addr not in visited:
+                    visited.add(meta.addr)
+                    try:
+                        directories.append(entry.as_directory())
+                    except IOError:
+                        pass
+
+    summary.mtimes = _epoch_range(count, low, high)
+    return summary
+
+
+def _epoch_range(count, low, high):
+    """
+    Build the TimestampRange of count mtimes, in seconds since the epoch,
+    spanning low to high
+    """
+    result = timestamps.TimestampRange()
+    result.count = count
+    if count:
+        result.begin = datetime.datetime.fromtimestamp(low, datetime.timezone.utc)
+        result.end = datetime.datetime.fromtimestamp(high, datetime.timezone.utc)
+    return result
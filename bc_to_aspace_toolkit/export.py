@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# export.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Offline payload export for bc_to_as.py. ExportClient stands in for
+# ArchivesSpaceClient during a dry run: every resource, archival object
+# and child payload is written to a JSON Lines file instead of being
+# sent, and placeholder URIs are handed back so the run can continue.
+# replay_export later sends an exported file to a real backend.
+#
+
+import json
+import threading
+
+from bc_to_aspace_toolkit.client import ArchivesSpaceError
+
+# Prefix of the placeholder URIs handed out during an export
+PLACEHOLDER_PREFIX = '/export'
+
+
+class ExportClient(object):
+    """
+    Drop-in replacement for ArchivesSpaceClient that never contacts a server
+
+    Every repository code given is reported as existing, no archival
+    object is ever found by ref_id, and every POST is appended to the
+    export file.
+
+    Args:
+        path (string): JSON Lines file to write (None to discard payloads)
+        repo_codes (array): repository codes to report as existing
+    """
+
+    def __init__(self, path, repo_codes=()):
+        self.path = path
+        self.host = 'export:' + (path or 'dry-run')
+        self.repositories = [
+            {'repo_code': repo_code, 'uri': PLACEHOLDER_PREFIX + '/repositories/' + str(i + 1)}
+            for i, repo_code in enumerate(repo_codes)]
+        self.children = {}
+        self.counts = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'w') if path else None
+        for repository in self.repositories:
+            self._write({'type': 'repository', 'repo_code': repository['repo_code'],
+                         'uri': repository['uri']})
+
+    def _write(self, record):
+        if self._file is not None:
+            self._file.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def _placeholder(self, api):
+        self._next_id += 1
+        return api + '/' + str(self._next_id)
+
+    def login(self):
+        return None
+
+    def get(self, api, params=None):
+        if api == '/repositories':
+            return list(self.repositories)
+        if api.endswith('/find_by_id/archival_objects'):
+            return {'archival_objects': []}
+        if api.endswith('/children'):
+            return list(self.children.get(api[:-len('/children')], []))
+        return {}
+
+    def post(self, api, data=None, params=None):
+        with self._lock:
+            kind = api.rsplit('/', 1)[-1]
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            if kind == 'children':
+                parent_uri = api[:-len('/children')]
+                for child in data['children']:
+                    child = dict(child, uri=self._placeholder(PLACEHOLDER_PREFIX + '/children'))
+                    self.children.setdefault(parent_uri, []).append(child)
+                self._write({'type': 'post', 'api': api, 'data': data})
+                return {'status': 'Updated', 'uri': parent_uri}
+
+            uri = None
+            if kind in ('resources', 'archival_objects'):
+                uri = self._placeholder(api)
+            self._write({'type': 'post', 'api': api, 'data': data, 'uri': uri})
+            return {'status': 'Created', 'uri': uri}
+
+    def run_concurrently(self, calls, concurrency=4):
+        return [self.post(api, data) if method == 'post' else self.get(api)
+                for method, api, data in calls]
+
+    def post_children(self, parent_uri, children, batch_size=1, concurrency=4):
+        if batch_size is None or batch_size <= 0:
+            batch_size = max(1, len(children))
+        outcomes = []
+        for start in range(0, len(children), batch_size):
+            batch = children[start:start + batch_size]
+            info = self.post(parent_uri + '/children', {'children': batch})
+            outcomes.extend([info] * len(batch))
+        return outcomes
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _substitute(value, uris):
+    """
+    Replace placeholder URIs (and paths under them) in an exported value
+    """
+    if isinstance(value, dict):
+        return dict((key, _substitute(item, uris)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_substitute(item, uris) for item in value]
+    if isinstance(value, str) and value.startswith(PLACEHOLDER_PREFIX):
+        # Try the whole path, then ever shorter leading parts of it
+        end = len(value)
+        while end > 0:
+            placeholder = value[:end]
+            if placeholder in uris:
+                return uris[placeholder] + value[end:]
+            end = value.rfind('/', 0, end)
+    return value
+
+
+def replay_export(client, path):
+    """
+    Send the payloads of an export file to an ArchivesSpace backend
+
+    Placeholder URIs are replaced with the URIs the backend assigns, in
+    the order the payloads were exported.
+
+    Args:
+        client (ArchivesSpaceClient): logged-in ArchivesSpace client
+        path (string): JSON Lines file written by ExportClient
+
+    Returns:
+        type: (number of payloads sent, list of (api, error) failures)
+    """
+    uris = {}
+    sent = 0
+    failures = []
+    repositories = None
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['type'] == 'repository':
+                if repositories is None:
+                    repositories = dict((repository['repo_code'], repository['uri'])
+                                        for repository in client.get('/repositories'))
+                if record['repo_code'] not in repositories:
+                    raise ValueError("Repository {} does not exist in this ArchivesSpace instance".format(
+                        record['repo_code']))
+                uris[record['uri']] = repositories[record['repo_code']]
+                continue
+
+            api = _substitute(record['api'], uris)
+            if api.startswith(PLACEHOLDER_PREFIX):
+                # The parent of this payload failed to replay
+                failures.append((api, 'unresolved placeholder'))
+                continue
+            try:
+                info = client.post(api, _substitute(record['data'], uris))
+            except ArchivesSpaceError as e:
+                failures.append((api, e))
+                continue
+            sent += 1
+            if record.get('uri'):
+                uris[record['uri']] = info['uri']
+    return sent, failures
@@ -0,0 +1,312 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# extract.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Extraction stage for bc_to_as.py: summarizes the Brunnhilde output of
+# each dataset directory (or loads its cached summary) and builds the
+# child archival object payload for it. Datasets are independent of each
+# other and of the ArchivesSpace backend, so they can be processed across
+# a pool of worker processes.
+#
+
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from bc_to_aspace_toolkit import dfxml
+from bc_to_aspace_toolkit import disk_image
+from bc_to_aspace_toolkit import notes
+from bc_to_aspace_toolkit import payloads
+from bc_to_aspace_toolkit import siegfried
+from bc_to_aspace_toolkit import summary as summary_cache
+from bc_to_aspace_toolkit.metrics import Metrics
+from bc_to_aspace_toolkit.summary import DatasetSummary
+
+
+# Brunnhilde reports by DatasetSummary attribute, for messages
+DERIVED_REPORT_NAMES = {
+    'format_report': 'formats.csv',
+    'format_versions': 'formatVersions.csv',
+    'mimetypes': 'mimetypes.csv',
+    'years': 'years.csv',
+}
+
+
+class DatasetResult(object):
+    """
+    Outcome of extracting a single dataset directory
+
+    Attributes:
+        dataset (DatasetEntry): the dataset directory, as found by the scanner
+        project_folder (string): name of the project folder
+        dataset_dir (string): name of the dataset directory (e.g. SET1_brunnout)
+        file_name (string): reference ID taken from the dataset directory name
+        dataset_path (string): full path of the dataset directory
+        summary (DatasetSummary): aggregates of the dataset's Brunnhilde output
+        dfxml_missing (bool): no dfxml.xml was found; Siegfried dates used
+        mtimes_missing (bool): dfxml.xml had no mtimes; Siegfried dates used
+        payload (dict): child archival object payload, or None if the
+            dataset could not be processed
+        messages (list): log lines produced while extracting
+        error (string): error message if extraction failed
+        metrics (Metrics): stage timings and byte counts of this dataset
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.project_folder = dataset.project
+        self.dataset_dir = dataset.name
+        self.file_name = dataset.name.split("_")[0]
+        self.dataset_path = dataset.path
+        self.summary = None
+        self.dfxml_missing = False
+        self.mtimes_missing = False
+        self.payload = None
+        self.messages = []
+        self.error = None
+        self.metrics = Metrics()
+
+    def log(self, message):
+        self.messages.append(message)
+
+    def needs_fallback(self):
+        return self.dfxml_missing or self.mtimes_missing
+
+
+def extract_dataset(dataset, use_summary_cache=False, image_engine=None,
+                    siegfried_engine='auto'):
+    """
+    Summarize the Brunnhilde output of one dataset directory and build
+    its child archival object payload
+
+    Args:
+        dataset (DatasetEntry): the dataset directory
+        use_summary_cache (bool): load the summary cached in the dataset
+            directory if its inputs are unchanged, and cache it otherwise
+        image_engine (string): if given, read the file system metadata of
+            a dataset with a disk image from the image, using this engine
+            (see disk_image.summarize_image), instead of from dfxml.xml
+        siegfried_engine (string): how siegfried.csv is parsed (see
+            siegfried.summarize_siegfried)
+
+    Returns:
+        type: DatasetResult
+    """
+    result = DatasetResult(dataset)
+    result.log("  [INFO] Found dataset directory {}".format(dataset.name))
+    result.log("  [INFO] Using reference ID {}".format(result.file_name))
+
+    try:
+        _extract_into(result, use_summary_cache, image_engine, siegfried_engine)
+    except Exception as e:
+        result.error = "{}: {}".format(type(e).__name__, e)
+        result.payload = None
+        result.metrics.increment('datasets_failed')
+    result.metrics.record_memory()
+    return result
+
+
+def _parsed(result, path):
+    result.metrics.increment('bytes_parsed', os.path.getsize(path))
+
+
+def _reads_image(dataset, image_engine):
+    return image_engine is not None and dataset.image_path is not None
+
+
+def summary_inputs(dataset, image_engine=None):
+    """
+    Returns:
+        type: the files a dataset's summary is computed from beyond
+            manifest.INPUT_FILES, relative to the dataset directory
+            (array)
+    """
+    if _reads_image(dataset, image_engine):
+        return [os.path.basename(dataset.image_path)]
+    return []
+
+
+def summary_engine(dataset, image_engine=None):
+    """
+    Returns:
+        type: the engine the disk image of a dataset is read with ('tsk'
+            or 'fiwalk', 'auto' if neither is available), or None if the
+            dataset is read from dfxml.xml
+    """
+    if not _reads_image(dataset, image_engine):
+        return None
+    if image_engine == 'auto':
+        return disk_image.available_engine() or image_engine
+    return image_engine
+
+
+def summarize_dataset(result, image_engine=None, siegfried_engine='auto'):
+    """
+    Read the Brunnhilde output of a dataset into a DatasetSummary
+
+    Args:
+        result (DatasetResult): the dataset being extracted; read files
+            are logged and timed on it
+        image_engine (string): read the disk image of the dataset, if it
+            has one, with this engine instead of dfxml.xml
+        siegfried_engine (string): how siegfried.csv is parsed
+
+    Returns:
+        type: DatasetSummary
+    """
+    dataset = result.dataset
+    metrics = result.metrics
+    summary = DatasetSummary()
+
+    if dataset.formats_path is not None:
+        with metrics.timer('formats_csv'):
+            summary.format_report = summary_cache.read_report(
+                dataset.formats_path, ['Format', 'ID', 'Count'])
+        _parsed(result, dataset.formats_path)
+        result.log("  [INFO] Read dataset at {}".format(dataset.formats_path))
+
+    reports = [('format_versions', dataset.format_versions_path, ['Format', 'ID', 'Version', 'Count']),
+               ('mimetypes', dataset.mimetypes_path, ['MIME type', 'Count']),
+               ('years', dataset.years_path, ['Year Last Modified', 'Count'])]
+    for attribute, path, columns in reports:
+        if path is not None:
+            with metrics.timer('reports_csv'):
+                setattr(summary, attribute, summary_cache.read_report(path, columns))
+            _parsed(result, path)
+
+    siegfried_path = dataset.siegfried_path
+    if siegfried_path is None:
+        raise IOError("No siegfried.csv found in {}".format(dataset.path))
+    with metrics.timer('siegfried_csv'):
+        siegfried_summary = siegfried.summarize_siegfried(siegfried_path,
+                                                          engine=siegfried_engine)
+    _parsed(result, siegfried_path)
+    result.log("  [INFO] Read dataset at {}".format(siegfried_path))
+    summary.file_count = siegfried_summary.file_count
+    summary.total_bytes = siegfried_summary.total_bytes
+    summary.modified = siegfried_summary.modified
+    summary.formats = siegfried_summary.formats
+
+    # Reports Brunnhilde did not write are rebuilt from the counts taken
+    #     while reading siegfried.csv
+    for attribute, rows in sorted(siegfried_summary.reports().items()):
+        if getattr(summary, attribute) is None and rows is not None:
+            setattr(summary, attribute, rows)
+            summary.derived_reports.append(attribute)
+
+    dfxml_path = dataset.dfxml_path
+    if _reads_image(dataset, image_engine):
+        with metrics.timer('disk_image'):
+            dfxml_summary = disk_image.summarize_image(dataset.image_path, image_engine)
+        result.log("  [INFO] Read file system metadata from {}".format(dataset.image_path))
+        summary.dfxml_file_count = dfxml_summary.file_count
+        summary.dfxml_bytes = dfxml_summary.total_bytes
+        summary.mtimes = dfxml_summary.mtimes
+    elif dfxml_path is not None:
+        with metrics.timer('dfxml'):
+            dfxml_summary = dfxml.summarize_dfxml(dfxml_path)
+        _parsed(result, dfxml_path)
+        result.log("  [INFO] Read dataset at {}".format(dfxml_path))
+        summary.dfxml_file_count = dfxml_summary.file_count
+        summary.dfxml_bytes = dfxml_summary.total_bytes
+        summary.mtimes = dfxml_summary.mtimes
+    return summary
+
+
+def _extract_into(result, use_summary_cache, image_engine=None, siegfried_engine='auto'):
+    dataset = result.dataset
+    metrics = result.metrics
+    if _reads_image(dataset, image_engine):
+        mtimes_path = dataset.image_path
+    else:
+        mtimes_path = dataset.dfxml_path
+
+    summary = None
+    if use_summary_cache:
+        # Fingerprint before reading, so that files changed mid-read are
+        # summarized again next time
+        fingerprint = summary_cache.fingerprint(
+            dataset.path, summary_inputs(dataset, image_engine),
+            summary_engine(dataset, image_engine))
+        summary = summary_cache.load_summary(dataset.path, fingerprint)
+        if summary is not None:
+            result.log("  [INFO] Loaded summary from {}".format(
+                summary_cache.summary_path(dataset.path)))
+            metrics.increment('summary_cache_hits')
+
+    if summary is None:
+        summary = summarize_dataset(result, image_engine, siegfried_engine)
+        if use_summary_cache:
+            metrics.increment('summary_cache_misses')
+            try:
+                summary_cache.save_summary(dataset.path, summary, fingerprint)
+            except (IOError, OSError) as e:
+                result.log("  [WARNING] Could not cache the summary of {}: {}".format(
+                    dataset.name, e))
+    result.summary = summary
+    metrics.increment('files', summary.file_count)
+
+    if summary.format_report is None:
+        result.log("  [WARNING] No formats.csv found in {}".format(
+            dataset.path + '/csv_reports'))
+    if summary.derived_reports:
+        result.log("  [INFO] No {} found in {}; counting from siegfried.csv instead".format(
+            ', '.join(DERIVED_REPORT_NAMES[attribute] for attribute in summary.derived_reports),
+            dataset.path + '/csv_reports'))
+    if summary.modified.problems():
+        result.log("  [WARNING] {} in {}".format(
+            summary.modified.problems(), dataset.siegfried_path))
+    if summary.mtimes is not None and summary.mtimes.problems():
+        result.log("  [WARNING] {} in {}".format(
+            summary.mtimes.problems(), mtimes_path))
+
+    # Siegfried dates are used when there is no dfxml.xml, or when it has
+    # no modified times (e.g. CD-ROM)
+    result.dfxml_missing = summary.dfxml_missing()
+    result.mtimes_missing = summary.mtimes_missing()
+    begin_date, end_date = summary.date_range()
+
+    if begin_date is None:
+        result.log("  [WARNING] No valid timestamps found for dataset {}, skipping...".format(
+            result.dataset_dir))
+        return
+
+    with metrics.timer('payload_build'):
+        note_detail, other_notes = notes.dataset_notes(summary)
+        result.payload = payloads.child_payload(
+            result.file_name, begin_date, end_date,
+            summary.total_bytes, note_detail, other_notes,
+            payloads.child_ref_id(result.project_folder, result.dataset_dir))
+    metrics.increment('datasets_extracted')
+
+
+def extract_datasets(jobs, workers=1, use_summary_cache=False, image_engine=None,
+                     siegfried_engine='auto'):
+    """
+    Extract many datasets, optionally across a pool of worker processes
+
+    Args:
+        jobs (array): DatasetEntry objects
+        workers (int): number of worker processes; 1 runs in this process
+        use_summary_cache (bool): use the summaries cached in the dataset
+            directories (see extract_dataset)
+        image_engine (string): read disk images with this engine instead
+            of dfxml.xml (see extract_dataset)
+        siegfried_engine (string): how siegfried.csv is parsed
+
+    Returns:
+        type: DatasetResult objects, in the same order as jobs (array)
+    """
+    extract = functools.partial(extract_dataset, use_summary_cache=use_summary_cache,
+                                image_engine=image_engine,
+                                siegfried_engine=siegfried_engine)
+    if workers is None or workers <= 1 or len(jobs) <= 1:
+        return [extract(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(extract, jobs))
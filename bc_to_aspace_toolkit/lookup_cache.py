@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# lookup_cache.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Persistent SQLite index of ArchivesSpace lookups (repo_code -> repository
+# URI, ref_id -> archival object and resource URIs), so that re-runs over
+# the same repository resolve parents without a round trip per folder.
+#
+
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTL = 24 * 60 * 60
+
+# Number of ref_ids sent in a single find_by_id request
+FIND_BY_ID_CHUNK = 50
+
+
+def default_cache_path():
+    """
+    Location of the lookup cache when none is given on the command line
+
+    Returns:
+        type: path (string)
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'bc_to_aspace_toolkit', 'lookup.sqlite')
+
+
+class LookupCache(object):
+    """
+    On-disk index of repository and archival object URIs for one backend
+
+    Entries older than ttl seconds are ignored and refreshed from the
+    backend on the next lookup.
+
+    Args:
+        path (string): path of the SQLite database file
+        host (string): API URL the cached URIs belong to
+        ttl (float): maximum age of an entry, in seconds
+    """
+
+    def __init__(self, path, host, ttl=DEFAULT_TTL):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.host = host.rstrip('/')
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS repositories ("
+                " host TEXT, repo_code TEXT, uri TEXT, fetched_at REAL,"
+                " PRIMARY KEY (host, repo_code))")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS archival_objects ("
+                " host TEXT, repository_uri TEXT, ref_id TEXT, uri TEXT,"
+                " resource_uri TEXT, fetched_at REAL,"
+                " PRIMARY KEY (host, repository_uri, ref_id))")
+
+    def _oldest_valid(self):
+        return time.time() - self.ttl
+
+    def get_repository_uri(self, repo_code):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT uri FROM repositories WHERE host = ? AND repo_code = ?"
+                " AND fetched_at >= ?",
+                (self.host, repo_code, self._oldest_valid())).fetchone()
+        return row[0] if row else None
+
+    def put_repositories(self, repositories):
+        """
+        Record the repo_code -> uri mapping of every repository listed
+        """
+        now = time.time()
+        rows = [(self.host, repository['repo_code'], repository['uri'], now)
+                for repository in repositories]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO repositories VALUES (?, ?, ?, ?)", rows)
+
+    def get_archival_objects(self, repository_uri, ref_ids):
+        """
+        Look up cached archival objects
+
+        Returns:
+            type: dict mapping ref_id to (archival object uri, resource uri)
+                for the ref_ids that have a valid entry
+        """
+        found = {}
+        oldest_valid = self._oldest_valid()
+        with self._lock:
+            for ref_id in ref_ids:
+                row = self._db.execute(
+                    "SELECT uri, resource_uri FROM archival_objects"
+                    " WHERE host = ? AND repository_uri = ? AND ref_id = ?"
+                    " AND fetched_at >= ?",
+                    (self.host, repository_uri, ref_id, oldest_valid)).fetchone()
+                if row:
+                    found[ref_id] = (row[0], row[1])
+        return found
+
+    def put_archival_object(self, repository_uri, ref_id, uri, resource_uri):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO archival_objects VALUES (?, ?, ?, ?, ?, ?)",
+                (self.host, repository_uri, ref_id, uri, resource_uri, time.time()))
+
+    def invalidate_archival_object(self, repository_uri, ref_id):
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM archival_objects"
+                " WHERE host = ? AND repository_uri = ? AND ref_id = ?",
+                (self.host, repository_uri, ref_id))
+
+    def clear(self):
+        """
+        Drop every entry recorded for this backend
+        """
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM repositories WHERE host = ?", (self.host,))
+            self._db.execute("DELETE FROM archival_objects WHERE host = ?", (self.host,))
+
+    def close(self):
+        self._db.close()
+
+
+def find_archival_objects(client, repository_uri, ref_ids):
+    """
+    Resolve many ref_ids with as few find_by_id requests as possible
+
+    The archival objects are resolved inline by the backend, so no
+    further request is needed per object.
+
+    Args:
+        client (ArchivesSpaceClient): logged-in ArchivesSpace client
+        repository_uri (string): URI of the repository to search
+        ref_ids (array): ref_ids to look up
+
+    Returns:
+        type: dict mapping ref_id to the archival object record, for the
+            ref_ids that exist in the repository
+    """
+    ref_ids = list(ref_ids)
+    found = {}
+    for start in range(0, len(ref_ids), FIND_BY_ID_CHUNK):
+        chunk = ref_ids[start:start + FIND_BY_ID_CHUNK]
+        response = client.get(repository_uri + '/find_by_id/archival_objects',
+                              params={'ref_id[]': chunk,
+                                      'resolve[]': 'archival_objects'})
+        for match in response.get('archival_objects', []):
+            record = match.get('_resolved')
+            if record is None:
+                record = client.get(match['ref'])
+            found[record['ref_id']] = record
+    return found
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# manifest.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Run manifest for bc_to_as.py. An append-only journal kept in the
+# repository directory records, for every dataset, a fingerprint of its
+# Brunnhilde output and the ArchivesSpace URI created for it, so that
+# later runs can skip unchanged datasets and resume interrupted ones.
+# Records are tagged with the backend they were written against; runs
+# against another backend do not see them.
+#
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+MANIFEST_NAME = '.bc_to_as_manifest.jsonl'
+
+# Dataset files whose contents determine the uploaded metadata, relative
+# to the dataset directory; the summary cache is keyed on the same files
+INPUT_FILES = ('siegfried.csv', 'csv_reports/formats.csv', 'dfxml.xml',
+               'csv_reports/formatVersions.csv', 'csv_reports/mimetypes.csv',
+               'csv_reports/years.csv')
+
+# Dataset states reported by RunManifest.status
+NEW = 'new'
+UNCHANGED = 'unchanged'
+CHANGED = 'changed'
+INTERRUPTED = 'interrupted'
+
+
+def _sha1(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(dataset_path, use_hash=False, names=INPUT_FILES, image_engine=None):
+    """
+    Fingerprint the input files of a dataset directory
+
+    Args:
+        dataset_path (string): path of the dataset directory
+        use_hash (bool): also hash the contents of the Brunnhilde and DFXML
+            outputs (INPUT_FILES), rather than relying on size and
+            modification time alone; other inputs such as disk images are
+            too large to read on every run
+        names (array): input files, relative to the dataset directory
+        image_engine (string): engine the disk image among names is read
+            with, if any; engines do not find the same files, so it is
+            part of the fingerprint
+
+    Returns:
+        type: dict mapping each input file to [size, mtime_ns] (plus the
+            sha1 of INPUT_FILES if use_hash), or None if the file does not
+            exist, and
+            'image_engine' to image_engine if given
+    """
+    result = {}
+    if image_engine is not None:
+        result['image_engine'] = image_engine
+    for name in names:
+        file_path = os.path.join(dataset_path, name)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            result[name] = None
+            continue
+        entry = [stat.st_size, stat.st_mtime_ns]
+        if use_hash and name in INPUT_FILES:
+            entry.append(_sha1(file_path))
+        result[name] = entry
+    return result
+
+
+def dataset_key(project_folder, dataset_dir):
+    return project_folder + '/' + dataset_dir
+
+
+class RunManifest(object):
+    """
+    Journal of dataset uploads for one repository directory
+
+    Each line of the journal is a JSON record; the last record for a
+    dataset describes its current state. Records written against another
+    backend are ignored, so their datasets count as new; records without
+    a host (written by earlier versions) are taken to belong to this one.
+
+    Args:
+        repo_dir (string): path of the local repository directory
+        use_hash (bool): fingerprint datasets by content hash as well
+        host (string): API URL of the backend uploaded to
+    """
+
+    def __init__(self, repo_dir, use_hash=False, host=None):
+        self.path = os.path.join(repo_dir, MANIFEST_NAME)
+        self.use_hash = use_hash
+        self.host = host.rstrip('/') if host else None
+        self.entries = {}
+        self._lock = threading.Lock()
+
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash; later lines still count
+                        continue
+                    if record.get('host') not in (None, self.host):
+                        continue
+                    self.entries[record['key']] = record
+
+    def fingerprint(self, dataset_path, extra_inputs=(), image_engine=None):
+        """
+        Args:
+            dataset_path (string): path of the dataset directory
+            extra_inputs (array): other files the dataset's metadata is
+                read from (e.g. a disk image), relative to the dataset
+                directory
+            image_engine (string): engine the disk image is read with
+        """
+        return fingerprint(dataset_path, self.use_hash, INPUT_FILES + tuple(extra_inputs),
+                           image_engine)
+
+    def status(self, key, current_fingerprint):
+        """
+        Compare a dataset against its last recorded state
+
+        Returns:
+            type: NEW, UNCHANGED, CHANGED or INTERRUPTED (string)
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return NEW
+        if entry['status'] != 'done':
+            return INTERRUPTED
+        if entry['fingerprint'] != current_fingerprint:
+            return CHANGED
+        return UNCHANGED
+
+    def uri(self, key):
+        entry = self.entries.get(key)
+        return entry.get('uri') if entry else None
+
+    def _append(self, record):
+        record['host'] = self.host
+        record['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        line = json.dumps(record, sort_keys=True)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[record['key']] = record
+
+    def record_started(self, key, current_fingerprint):
+        previous = self.entries.get(key, {})
+        self._append({'key': key, 'status': 'started',
+                      'fingerprint': current_fingerprint,
+                      'uri': previous.get('uri')})
+
+    def record_done(self, key, current_fingerprint, uri):
+        self._append({'key': key, 'status': 'done',
+                      'fingerprint': current_fingerprint, 'uri': uri})
+
+    def record_failed(self, key, current_fingerprint, error):
+        previous = self.entries.get(key, {})
+        self._append({'key': key, 'status': 'failed',
+                      'fingerprint': current_fingerprint,
+                      'uri': previous.get('uri'), 'error': str(error)})
@@ -0,0 +1,280 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# metrics.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Timing and counting instrumentation for bc_to_as.py. A Metrics object
+# collects stage timers, counters, latency histograms and the memory
+# high-water mark; worker processes fill their own and send them back
+# with their results to be merged. The totals can be written as JSON or
+# as a Prometheus textfile (for the node_exporter textfile collector).
+#
+
+import contextlib
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Upper bounds, in seconds, of the HTTP latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prefix of every metric name in the Prometheus textfile
+PROMETHEUS_PREFIX = 'bc_to_as'
+
+
+def peak_rss_bytes():
+    """
+    Returns:
+        type: peak resident set size of this process, in bytes (int), or
+            None where it cannot be measured
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
+
+class Histogram(object):
+    """
+    Counts of observed values per bucket
+
+    Attributes:
+        buckets (tuple): bucket upper bounds, in increasing order
+        counts (list): observations per bucket, plus one for values above
+            the last bound
+        count (int): number of observations
+        total (float): sum of the observations
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        if other.buckets != self.buckets:
+            raise ValueError("Cannot merge histograms with different buckets")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+
+    def quantile(self, q):
+        """
+        Returns:
+            type: upper bound of the bucket holding the q-th quantile
+                (float), inf if it lies above the last bucket, or None if
+                nothing was observed
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self):
+        return {'buckets': list(self.buckets), 'counts': list(self.counts),
+                'count': self.count, 'sum': round(self.total, 6)}
+
+
+class Metrics(object):
+    """
+    Stage timers, counters and histograms for one run (or one dataset)
+
+    All methods are safe to call from several threads.
+
+    Attributes:
+        timers (dict): stage name -> [calls, seconds]
+        counters (dict): counter name -> value
+        histograms (dict): histogram name -> Histogram
+        datasets (dict): dataset key -> {stage name: seconds}
+        peak_rss (int): highest resident set size recorded, in bytes
+    """
+
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        self.histograms = {}
+        self.datasets = {}
+        self.peak_rss = None
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """
+        Time the body of a with statement as one call of stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage, seconds, calls=1):
+        with self._lock:
+            timer = self.timers.setdefault(stage, [0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(buckets)
+            self.histograms[name].observe(value)
+
+    def record_memory(self):
+        """
+        Raise peak_rss to the current high-water mark of this process
+        """
+        rss = peak_rss_bytes()
+        if rss is not None:
+            with self._lock:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+
+    def add_dataset(self, key, dataset_metrics):
+        """
+        Merge the metrics of one dataset, keeping its stage times apart
+        """
+        self.merge(dataset_metrics)
+        with self._lock:
+            self.datasets[key] = dict((stage, round(seconds, 6))
+                                      for stage, (calls, seconds) in dataset_metrics.timers.items())
+
+    def merge(self, other):
+        with self._lock:
+            for stage, (calls, seconds) in other.timers.items():
+                timer = self.timers.setdefault(stage, [0, 0.0])
+                timer[0] += calls
+                timer[1] += seconds
+            for name, value in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, histogram in other.histograms.items():
+                if name not in self.histograms:
+                    self.histograms[name] = Histogram(histogram.buckets)
+                self.histograms[name].merge(histogram)
+            self.datasets.update(other.datasets)
+            if other.peak_rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, other.peak_rss)
+
+    # The Metrics lock cannot be pickled, which worker processes need
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'timers': dict((stage, {'calls': calls, 'seconds': round(seconds, 6)})
+                               for stage, (calls, seconds) in self.timers.items()),
+                'counters': dict(self.counters),
+                'histograms': dict((name, histogram.to_dict())
+                                   for name, histogram in self.histograms.items()),
+                'peak_rss_bytes': self.peak_rss,
+                'datasets': dict(self.datasets),
+            }
+
+    def to_prometheus(self):
+        """
+        Returns:
+            type: the metrics in the Prometheus text exposition format (string)
+        """
+        prefix = PROMETHEUS_PREFIX
+        lines = []
+        with self._lock:
+            lines.append('# HELP {}_stage_seconds_total Time spent in each stage.'.format(prefix))
+            lines.append('# TYPE {}_stage_seconds_total counter'.format(prefix))
+            for stage, (calls, seconds) in sorted(self.timers.items()):
+                lines.append('{}_stage_seconds_total{{stage="{}"}} {:.6f}'.format(prefix, stage, seconds))
+            lines.append('# TYPE {}_stage_calls_total counter'.format(prefix))
+            for stage, (calls, seconds) in sorted(self.timers.items()):
+                lines.append('{}_stage_calls_total{{stage="{}"}} {}'.format(prefix, stage, calls))
+
+            for name, value in sorted(self.counters.items()):
+                lines.append('# TYPE {}_{}_total counter'.format(prefix, name))
+                lines.append('{}_{}_total {}'.format(prefix, name, value))
+
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append('# TYPE {}_{} histogram'.format(prefix, name))
+                cumulative = 0
+                for bound, n in zip(histogram.buckets, histogram.counts):
+                    cumulative += n
+                    lines.append('{}_{}_bucket{{le="{}"}} {}'.format(prefix, name, bound, cumulative))
+                lines.append('{}_{}_bucket{{le="+Inf"}} {}'.format(prefix, name, histogram.count))
+                lines.append('{}_{}_sum {:.6f}'.format(prefix, name, histogram.total))
+                lines.append('{}_{}_count {}'.format(prefix, name, histogram.count))
+
+            if self.peak_rss is not None:
+                lines.append('# TYPE {}_peak_rss_bytes gauge'.format(prefix))
+                lines.append('{}_peak_rss_bytes {}'.format(prefix, self.peak_rss))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Write the metrics to path: a Prometheus textfile if its name ends
+        in .prom, JSON otherwise
+        """
+        if path.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=2, sort_keys=True) + '\n'
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def summary(self):
+        """
+        Returns:
+            type: human-readable summary lines (array)
+        """
+        lines = []
+        with self._lock:
+            timers = sorted(self.timers.items(), key=lambda item: -item[1][1])
+            if timers:
+                lines.append("  [INFO] Time by stage: " + ', '.join(
+                    '{} {:.2f}s'.format(stage, seconds) for stage, (calls, seconds) in timers))
+            if self.counters:
+                lines.append("  [INFO] Counts: " + ', '.join(
+                    '{} {}'.format(name, value) for name, value in sorted(self.counters.items())))
+            latency = self.histograms.get('http_latency_seconds')
+            if latency is not None and latency.count:
+                lines.append("  [INFO] HTTP latency: {} requests, mean {:.3f}s, p50 <= {}s, p95 <= {}s".format(
+                    latency.count, latency.total / latency.count,
+                    latency.quantile(0.5), latency.quantile(0.95)))
+            if self.peak_rss is not None:
+                lines.append("  [INFO] Peak memory: {:.1f} MB".format(self.peak_rss / 1048576.0))
+        return lines
@@ -0,0 +1,296 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# mock_backend.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# A small in-memory stand-in for the ArchivesSpace backend API, covering
+# the endpoints bc_to_as.py uses. It is meant for exercising and timing
+# the script offline, not for storing anything: all records are lost
+# when it stops. Run it with
+#
+#   python -m bc_to_aspace_toolkit.mock_backend --repository test_repository
+#
+
+import json
+import re
+import threading
+import time
+import uuid
+from argparse import ArgumentParser
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    raise ImportError("The mock backend requires Python 3")
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MockArchivesSpace(object):
+    """
+    In-memory ArchivesSpace backend
+
+    Args:
+        repositories (array): repo_codes of the repositories that exist
+        host (string): interface to listen on
+        port (int): port to listen on; 0 picks a free port
+        latency (float): seconds added to every response
+        username (string): accepted username (None accepts any)
+        password (string): accepted password (None accepts any)
+    """
+
+    def __init__(self, repositories=('test_repository',), host='127.0.0.1',
+                 port=0, latency=0.0, username=None, password=None):
+        self.latency = latency
+        self.username = username
+        self.password = password
+        self.sessions = set()
+        self.records = {}
+        self.children = {}
+        self.request_count = 0
+        self.max_page_size = 250
+        self._next_ids = {}
+        self._lock = threading.Lock()
+
+        self.repositories = []
+        for repo_code in repositories:
+            repo_id = self._next_id('repositories')
+            self.repositories.append({
+                'jsonmodel_type': 'repository', 'repo_code': repo_code,
+                'name': repo_code, 'uri': '/repositories/{}'.format(repo_id)})
+
+        self.server = _ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        """
+        Serve requests from a background thread
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def _next_id(self, kind):
+        self._next_ids[kind] = self._next_ids.get(kind, 0) + 1
+        return self._next_ids[kind]
+
+    # Request handling
+
+    def _handler_class(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            def _dispatch(self, method):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if backend.latency:
+                    time.sleep(backend.latency)
+                status, result = backend.handle(
+                    method, url.path, query, body,
+                    self.headers.get('X-ArchivesSpace-Session'))
+                data = json.dumps(result).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def handle(self, method, path, query, body, session_id):
+        """
+        Answer one API request
+
+        Returns:
+            type: (HTTP status, JSON-serializable response)
+        """
+        with self._lock:
+            self.request_count += 1
+
+        match = re.match(r'^/users/([^/]+)/login$', path)
+        if match and method == 'POST':
+            return self._login(match.group(1), query.get('password', [''])[0])
+
+        if session_id not in self.sessions:
+            return 412, {'code': 'SESSION_GONE',
+                         'error': 'No session found for {}'.format(session_id)}
+
+        try:
+            data = json.loads(body.decode('utf-8')) if body else None
+        except ValueError:
+            return 400, {'error': 'Had some trouble parsing your request'}
+
+        with self._lock:
+            if path == '/repositories' and method == 'GET':
+                return 200, self.repositories
+
+            match = re.match(r'^(/repositories/\d+)/find_by_id/archival_objects$', path)
+            if match and method == 'GET':
+                return self._find_by_id(match.group(1), query)
+
+            match = re.match(r'^(/repositories/\d+)/(resources|archival_objects)$', path)
+            if match and method == 'POST':
+                return self._create(match.group(1), match.group(2), data)
+            if match and method == 'GET':
+                return self._id_set(match.group(1), match.group(2), query)
+
+            match = re.match(r'^(/repositories/\d+/archival_objects/\d+)/children$', path)
+            if match and match.group(1) in self.records:
+                if method == 'POST':
+                    return self._add_children(match.group(1), data)
+                return 200, [self.records[uri] for uri in self.children.get(match.group(1), [])]
+
+            if path in self.records:
+                if method == 'GET':
+                    return 200, self.records[path]
+                return self._update(path, data)
+
+        return 404, {'error': 'Record not found'}
+
+    def _login(self, username, password):
+        if (self.username is not None and username != self.username) or \
+                (self.password is not None and password != self.password):
+            return 403, {'error': 'Login failed'}
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self.sessions.add(session_id)
+        return 200, {'session': session_id, 'user': {'username': username}}
+
+    def expire_sessions(self):
+        """
+        Forget every session, as if the backend had been restarted
+        """
+        with self._lock:
+            self.sessions.clear()
+
+    def _find_by_id(self, repository_uri, query):
+        resolve = 'archival_objects' in query.get('resolve[]', [])
+        matches = []
+        for ref_id in query.get('ref_id[]', []):
+            for uri, record in self.records.items():
+                if record.get('ref_id') == ref_id and uri.startswith(repository_uri + '/archival_objects/'):
+                    match = {'ref': uri}
+                    if resolve:
+                        match['_resolved'] = record
+                    matches.append(match)
+        return 200, {'archival_objects': matches}
+
+    def _id_set(self, repository_uri, kind, query):
+        ids = query.get('id_set[]', [])
+        if not ids:
+            return 400, {'error': {'id_set': ['page, all_ids or id_set is required']}}
+        if len(ids) > self.max_page_size:
+            return 400, {'error': {'id_set': ['must contain at most {} ids'.format(self.max_page_size)]}}
+        uris = ['{}/{}/{}'.format(repository_uri, kind, record_id) for record_id in ids]
+        return 200, [self.records[uri] for uri in uris if uri in self.records]
+
+    def _validate(self, record, prefix=''):
+        errors = {}
+        if not record.get('title'):
+            errors[prefix + 'title'] = ['Property is required but was missing']
+        for i, date in enumerate(record.get('dates') or []):
+            if not date.get('begin') and not date.get('expression'):
+                errors['{}dates/{}/begin'.format(prefix, i)] = ['is required']
+        return errors
+
+    def _store(self, repository_uri, kind, record):
+        record_id = self._next_id(kind)
+        uri = '{}/{}/{}'.format(repository_uri, kind, record_id)
+        record = dict(record, uri=uri, lock_version=0)
+        if kind == 'archival_objects' and not record.get('ref_id'):
+            record['ref_id'] = uuid.uuid4().hex
+        self.records[uri] = record
+        return record_id, uri
+
+    def _create(self, repository_uri, kind, record):
+        if not isinstance(record, dict):
+            return 400, {'error': 'Expected a JSON object'}
+        errors = self._validate(record)
+        if errors:
+            return 400, {'error': errors}
+        record_id, uri = self._store(repository_uri, kind, record)
+        return 200, {'status': 'Created', 'id': record_id, 'lock_version': 0,
+                     'stale': None, 'uri': uri, 'warnings': []}
+
+    def _update(self, uri, record):
+        current = self.records[uri]
+        if record.get('lock_version') != current['lock_version']:
+            return 409, {'error': {'conflicting_record': [uri]}}
+        errors = self._validate(record)
+        if errors:
+            return 400, {'error': errors}
+        self.records[uri] = dict(record, uri=uri,
+                                 lock_version=current['lock_version'] + 1)
+        return 200, {'status': 'Updated', 'id': int(uri.rsplit('/', 1)[1]),
+                     'lock_version': current['lock_version'] + 1,
+                     'stale': None, 'uri': uri, 'warnings': []}
+
+    def _add_children(self, parent_uri, data):
+        children = (data or {}).get('children') or []
+        errors = {}
+        for i, child in enumerate(children):
+            errors.update(self._validate(child, 'children/{}/'.format(i)))
+        if errors:
+            return 400, {'error': errors}
+
+        # All children of a request are saved together, or not at all
+        repository_uri = parent_uri.split('/archival_objects/')[0]
+        for child in children:
+            child = dict(child, parent={'ref': parent_uri})
+            record_id, uri = self._store(repository_uri, 'archival_objects', child)
+            self.children.setdefault(parent_uri, []).append(uri)
+        return 200, {'status': 'Updated', 'id': int(parent_uri.rsplit('/', 1)[1]),
+                     'lock_version': self.records[parent_uri]['lock_version'],
+                     'stale': None, 'warnings': []}
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(prog='mock_backend.py', description='Run an in-memory stand-in for the ArchivesSpace backend API')
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=8089, help="Port to listen on (default: %(default)s)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response (default: %(default)s)")
+    parser.add_argument('--repository', action='append', help="repo_code of a repository to create; may be repeated (default: test_repository)")
+    parser.add_argument('--username', help="Only accept this username")
+    parser.add_argument('--password', help="Only accept this password")
+    args = parser.parse_args()
+
+    backend = MockArchivesSpace(args.repository or ['test_repository'], args.host,
+                                args.port, args.latency, args.username, args.password)
+    print("  [INFO] Mock ArchivesSpace backend listening on {}".format(backend.url))
+    try:
+        backend.serve_forever()
+    except KeyboardInterrupt:
+        print("  [INFO] Stopping...")
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# notes.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Note generation for bc_to_as.py. The histogram reports Brunnhilde
+# writes for each dataset (formats with their PRONOM IDs and versions,
+# MIME types, and years last modified) become the physdesc notes of the
+# dataset's child archival object. The reports hold one row per distinct
+# value, already counted, so each note line is a single string join.
+#
+
+# Labels of the notes that follow the format note
+MIMETYPES_LABEL = 'MIME types'
+YEARS_LABEL = 'Years last modified'
+
+
+def _format_label(format_name, format_id, version=''):
+    # String format of Siegfried output may yield an empty format name.
+    # Check and replace with the phrase unidentified files if needed
+    if not format_name:
+        return 'unidentified files'
+    label = format_name
+    if version:
+        label += ' ' + version
+    if format_id:
+        label += ' (' + format_id + ')'
+    return label
+
+
+def format_lines(rows, with_versions=False):
+    """
+    Create note lines documenting the file counts of each format
+
+    Args:
+        rows (array): [format, PRONOM id, count] rows of formats.csv, or
+            [format, PRONOM id, version, count] rows of formatVersions.csv
+            if with_versions is True
+        with_versions (bool): rows have a version column
+
+    Returns:
+        type: note lines, e.g. "Number of JPEG File Interchange Format
+            1.01 (fmt/43): 11041" (array)
+    """
+    if with_versions:
+        return ['Number of ' + _format_label(format_name, format_id, version) + ': ' + str(count)
+                for format_name, format_id, version, count in rows]
+    return ['Number of ' + _format_label(format_name, format_id) + ': ' + str(count)
+            for format_name, format_id, count in rows]
+
+
+def histogram_lines(rows, prefix, suffix, blank):
+    """
+    Create note lines documenting the file counts of a [value, count]
+    report such as mimetypes.csv or years.csv
+
+    Args:
+        rows (array): [value, count] rows
+        prefix (string): text before each value
+        suffix (string): text after each value
+        blank (string): text standing for an empty value
+
+    Returns:
+        type: note lines, "<prefix><value><suffix>: <count>" (array)
+    """
+    return [(prefix + value + suffix if value else blank) + ': ' + str(count)
+            for value, count in rows]
+
+
+def dataset_notes(summary):
+    """
+    Build every note of a dataset's child archival object from its
+    DatasetSummary
+
+    Args:
+        summary (DatasetSummary): aggregates of the dataset
+
+    Returns:
+        type: (format note lines, [(label, lines)] of the other notes);
+            reports the summary lacks are left out
+    """
+    if summary.format_versions is not None:
+        format_detail = format_lines(summary.format_versions, with_versions=True)
+    elif summary.format_report is not None:
+        format_detail = format_lines(summary.format_report)
+    else:
+        format_detail = []
+
+    other_notes = []
+    if summary.mimetypes:
+        other_notes.append((MIMETYPES_LABEL, histogram_lines(
+            summary.mimetypes, 'Number of ', ' files', 'Number of files with no MIME type')))
+    if summary.years:
+        # Oldest first, whatever order the report lists them in
+        years = sorted(summary.years, key=lambda row: row[0])
+        other_notes.append((YEARS_LABEL, histogram_lines(
+            years, 'Number of files last modified in ', '', 'Number of files with no modified date')))
+    return format_detail, other_notes
@@ -0,0 +1,213 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# payloads.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Payload builder for bc_to_as.py. The JSON templates in json_templates
+# are read and checked once per process; every resource, archival object
+# and child payload is then a structured copy of its template with the
+# extracted values filled in.
+#
+
+import json
+
+from bc_to_aspace_toolkit import utilities
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fields each template must provide, as paths of keys and list indexes
+TEMPLATE_FIELDS = {
+    'create_archival_objects': [('title',), ('level',), ('ref_id',), ('resource', 'ref'),
+                                ('dates',), ('extents',), ('notes',)],
+    'create_child_archival_objects': [('children', 0, 'title'), ('children', 0, 'level'),
+                                      ('children', 0, 'resource', 'ref'),
+                                      ('children', 0, 'dates', 0, 'begin'),
+                                      ('children', 0, 'extents', 0, 'number'),
+                                      ('children', 0, 'notes', 0, 'content')],
+    'create_repositories': [('repo_code',), ('name',)],
+    'create_resources': [('title',), ('id_0',), ('level',), ('dates', 0, 'begin'),
+                         ('extents', 0, 'number'), ('notes',)],
+}
+
+_templates = {}
+
+
+class TemplateError(ValueError):
+    """
+    Raised when a packaged JSON template is missing or lacks a field
+    """
+
+
+def load_templates():
+    """
+    Read and check every template in json_templates, once per process
+
+    Returns:
+        type: dict mapping template names (without .json) to templates
+
+    Raises:
+        TemplateError: a template could not be read or lacks a field
+    """
+    if _templates:
+        return _templates
+
+    templates = {}
+    for name, fields in TEMPLATE_FIELDS.items():
+        try:
+            with utilities.get_json_template(name + '.json') as stream:
+                template = json.load(stream)
+        except (IOError, OSError, ValueError) as e:
+            raise TemplateError("Could not read template {}.json: {}".format(name, e))
+        for path in fields:
+            value = template
+            try:
+                for key in path:
+                    value = value[key]
+            except (KeyError, IndexError, TypeError):
+                raise TemplateError("Template {}.json has no field {}".format(
+                    name, '/'.join(str(key) for key in path)))
+        templates[name] = template
+    _templates.update(templates)
+    return _templates
+
+
+def copy_value(value):
+    """
+    Copy a JSON-compatible value; much cheaper than copy.deepcopy, which
+    has to handle arbitrary objects and cycles
+    """
+    if isinstance(value, dict):
+        return dict((key, copy_value(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [copy_value(item) for item in value]
+    return value
+
+
+def template(name):
+    """
+    Returns:
+        type: a fresh copy of the named template (dict)
+    """
+    return copy_value(load_templates()[name])
+
+
+def dumps(value):
+    """
+    Serialize a payload to JSON, using orjson when it is installed
+
+    Returns:
+        type: JSON document (bytes)
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def _fill_dates(date, begin_date, end_date, label=None):
+    date['begin'] = begin_date.strftime('%Y-%m-%d')
+    date['end'] = end_date.strftime('%Y-%m-%d')
+    if label is not None:
+        date['label'] = label
+    if begin_date.strftime('%Y-%m') < end_date.strftime('%Y-%m'):
+        date['expression'] = begin_date.strftime('%Y-%m') + '-' + end_date.strftime('%Y-%m')
+    else:
+        date['expression'] = begin_date.strftime('%Y')
+
+
+def resource_payload(title, id_0, begin_date, end_date, extent_number='Unknown'):
+    """
+    Build the payload of a resource for a project folder
+
+    Args:
+        title (string): title of the resource
+        id_0 (string): identifier of the resource
+        begin_date (date): start of the date range
+        end_date (date): end of the date range
+        extent_number (string): extent in megabytes
+
+    Returns:
+        type: resource payload (dict)
+    """
+    resource = template('create_resources')
+    resource['id_0'] = id_0
+    resource['dates'][0]['begin'] = begin_date.strftime('%Y-%m-%d')
+    resource['dates'][0]['end'] = end_date.strftime('%Y-%m-%d')
+    resource['extents'][0]['number'] = extent_number
+    resource['notes'] = []
+    resource['level'] = 'file'
+    resource['title'] = title
+    return resource
+
+
+def archival_object_payload(title, ref_id, resource_uri):
+    """
+    Build the payload of a parent archival object for a project folder
+
+    Returns:
+        type: archival object payload (dict)
+    """
+    archival_object = template('create_archival_objects')
+    archival_object['title'] = title
+    archival_object['level'] = 'file'
+    archival_object['ref_id'] = ref_id
+    archival_object['resource']['ref'] = resource_uri
+    archival_object['dates'] = []
+    archival_object['extents'] = []
+    archival_object['notes'] = []
+    return archival_object
+
+
+def child_ref_id(project_folder, dataset_dir):
+    """
+    Returns:
+        type: ref_id of the child archival object of a dataset (string);
+            the /children response does not give the URIs of the records
+            it creates, so they are looked up by it
+    """
+    return (project_folder + '__' + dataset_dir).replace(' ', '_')
+
+
+def child_payload(title, begin_date, end_date, total_bytes, note_detail, other_notes=(),
+                  ref_id=None):
+    """
+    Build the /children payload of one dataset
+
+    Args:
+        title (string): title of the child archival object
+        begin_date (date): earliest modified date
+        end_date (date): latest modified date
+        total_bytes (int): aggregate size of the files in the dataset
+        note_detail (array): physdesc note lines
+        other_notes (array): (label, lines) of further physdesc notes
+        ref_id (string): ref_id of the child archival object, from
+            child_ref_id; the backend assigns one if None
+
+    Returns:
+        type: {'children': [child archival object]} (dict); the resource
+            ref is left for the upload stage to fill in
+    """
+    payload = template('create_child_archival_objects')
+    child = payload['children'][0]
+
+    # Get total file sizes, converting from bytes to megabytes at 2 dec. places
+    child['extents'][0]['number'] = str(round((total_bytes / 1048576), 2))
+    _fill_dates(child['dates'][0], begin_date, end_date, 'modified')
+    child['level'] = 'file'
+    child['title'] = title
+    child['ref_id'] = ref_id
+    note = child['notes'][0]
+    note['content'] = note_detail
+    note['type'] = 'physdesc'
+    for label, lines in other_notes:
+        other_note = copy_value(note)
+        other_note['label'] = label
+        other_note['content'] = lines
+        child['notes'].append(other_note)
+    return payload
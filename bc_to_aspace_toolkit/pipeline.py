@@ -0,0 +1,233 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# pipeline.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Bounded producer/consumer pipeline for bc_to_as.py. Datasets are
+# extracted across a pool of worker processes, reviewed one at a time in
+# the calling thread, and handed to upload threads, so that reading the
+# next datasets overlaps with uploading the previous ones. A fixed number
+# of permits bounds how far extraction may run ahead of the uploads. On
+# Ctrl-C or on a failed upload, no new work is started and the uploads
+# already under way are allowed to finish before returning.
+#
+
+import collections
+import queue
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+
+# Seconds between checks for a stop request while waiting
+POLL_INTERVAL = 0.1
+
+# Pipeline outcomes returned by Pipeline.run
+COMPLETED = 'completed'
+INTERRUPTED = 'interrupted'
+FAILED = 'failed'
+
+_DONE = object()
+
+
+def _ignore_interrupts():
+    # Worker processes leave Ctrl-C to the main process, which drains
+    # the pipeline rather than losing work in progress
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class Pipeline(object):
+    """
+    Extract, review and upload stages connected by bounded queues
+
+    Every job submitted for extraction takes one permit; the caller gives
+    it back with release() once the job has been uploaded or dropped, so
+    that at most max_pending jobs are ever extracted ahead of the uploads.
+
+    Args:
+        extract (callable): function of a job argument, returning its
+            result; it must be picklable when workers > 1
+        upload (callable): function of an upload task, run in the upload
+            threads
+        workers (int): extraction processes; 1 extracts in this thread
+        upload_workers (int): upload threads
+        max_pending (int): maximum number of jobs holding a permit; None
+            for no limit
+        hold_uploads (bool): start uploading only once every job has been
+            reviewed (e.g. when reviewing may prompt the user)
+    """
+
+    def __init__(self, extract, upload, workers=1, upload_workers=1,
+                 max_pending=None, hold_uploads=False):
+        self.extract = extract
+        self.upload = upload
+        self.workers = max(1, workers or 1)
+        self.upload_workers = max(1, upload_workers or 1)
+        self.hold_uploads = hold_uploads
+        self.failures = []
+        self._permits = threading.Semaphore(max_pending) if max_pending else None
+        self._uploads = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def stopped(self):
+        return self._stop.is_set()
+
+    def release(self, count=1):
+        """
+        Give back the permits of count jobs that have left the pipeline
+        """
+        if self._permits is not None:
+            for _ in range(count):
+                self._permits.release()
+
+    def submit_upload(self, task):
+        """
+        Queue a task for the upload threads; called by the review function
+        """
+        if not self._stop.is_set():
+            self._uploads.put(task)
+
+    def stop(self):
+        """
+        Stop taking new work; uploads under way are finished
+        """
+        self._stop.set()
+        while True:
+            try:
+                self._uploads.get_nowait()
+            except queue.Empty:
+                break
+        for _ in self._threads:
+            self._uploads.put(_DONE)
+
+    def _upload_loop(self):
+        while True:
+            task = self._uploads.get()
+            if task is _DONE or self._stop.is_set():
+                return
+            try:
+                self.upload(task)
+            except Exception as e:
+                self.failures.append(e)
+                self.stop()
+                return
+
+    def _start_uploads(self):
+        for _ in range(self.upload_workers):
+            thread = threading.Thread(target=self._upload_loop, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _acquire(self, block):
+        if self._permits is None:
+            return True
+        if block:
+            return self._permits.acquire(timeout=POLL_INTERVAL)
+        return self._permits.acquire(blocking=False)
+
+    def _submit(self, executor, argument):
+        if executor is not None:
+            return executor.submit(self.extract, argument)
+        future = Future()
+        try:
+            future.set_result(self.extract(argument))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _wait_for_uploads(self):
+        if self.hold_uploads and not self._stop.is_set():
+            self._start_uploads()
+        if not self._stop.is_set():
+            for _ in self._threads:
+                self._uploads.put(_DONE)
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(POLL_INTERVAL)
+
+    def run(self, jobs, review):
+        """
+        Run every job through the pipeline
+
+        Args:
+            jobs (iterable): (context, argument) pairs; argument is passed
+                to extract in a worker process
+            review (callable): function of (context, result), called in
+                this thread in the order of jobs; it may queue upload
+                tasks with submit_upload and give back permits with release
+
+        Returns:
+            type: COMPLETED, INTERRUPTED (Ctrl-C) or FAILED (an upload or
+                extraction raised; see failures)
+        """
+        if not self.hold_uploads:
+            self._start_uploads()
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers,
+                                           initializer=_ignore_interrupts)
+        # Results are reviewed in order, so extractions are only started
+        #     a little ahead of the one being waited for
+        in_flight = self.workers * 2 if executor is not None else 1
+        jobs = iter(jobs)
+        pending = collections.deque()
+        exhausted = False
+        outcome = COMPLETED
+        try:
+            try:
+                while not self._stop.is_set():
+                    # Start extractions for as long as there are permits
+                    while not exhausted and len(pending) < in_flight and \
+                            self._acquire(block=not pending):
+                        job = next(jobs, None)
+                        if job is None:
+                            exhausted = True
+                            self.release()
+                            break
+                        context, argument = job
+                        pending.append((context, self._submit(executor, argument)))
+                    if not pending:
+                        if exhausted:
+                            break
+                        continue
+
+                    # Review the results in order
+                    context, future = pending[0]
+                    try:
+                        result = future.result(timeout=POLL_INTERVAL)
+                    except TimeoutError:
+                        continue
+                    pending.popleft()
+                    review(context, result)
+                if self._stop.is_set():
+                    outcome = FAILED
+                else:
+                    self._wait_for_uploads()
+                    if self.failures:
+                        outcome = FAILED
+            except KeyboardInterrupt:
+                outcome = INTERRUPTED
+                print("  [ABORT] Interrupted: finishing the uploads already under way"
+                      " (press Ctrl-C again to quit at once)...")
+                self.stop()
+            except Exception as e:
+                self.failures.append(e)
+                outcome = FAILED
+                self.stop()
+
+            if outcome != COMPLETED:
+                # Extractions not yet started are dropped
+                for context, future in pending:
+                    future.cancel()
+                if executor is not None:
+                    executor.shutdown(wait=False)
+                    executor = None
+                self._wait_for_uploads()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return outcome
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# scanner.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Repository tree scanner. Lists the project and dataset directories of a
+# local repository structure, and the Brunnhilde outputs each dataset
+# holds, without descending any further (dataset directories may contain
+# entire recovered file systems).
+#
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_EXCLUDE = ('__pycache__', 'json_templates')
+
+# Extensions of the disk image files looked for in dataset directories;
+# kept here rather than in disk_image so the scanner, which utilities
+# imports, does not depend on the parsing modules
+IMAGE_EXTENSIONS = ('.e01', '.aff', '.raw', '.dd', '.img', '.iso')
+
+# Brunnhilde reports read from csv_reports, and the DatasetEntry
+# attributes holding their paths
+CSV_REPORTS = {
+    'formats.csv': 'formats_path',
+    'formatVersions.csv': 'format_versions_path',
+    'mimetypes.csv': 'mimetypes_path',
+    'years.csv': 'years_path',
+}
+
+
+def is_disk_image(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _is_nonempty_dir(path):
+    scanner = os.scandir(path)
+    try:
+        return next(scanner, None) is not None
+    finally:
+        scanner.close()
+
+
+def list_subdirectories(dir_path, exclude=DEFAULT_EXCLUDE):
+    """
+    Get names of the non-empty first-level folders in a given folder
+
+    Args:
+        dir_path (str): the path of the given folder;
+        exclude (array): the folders not to be retrieved;
+    Returns:
+        type: folder names, sorted (array).
+    """
+    names = []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            if entry.name in exclude or not entry.is_dir():
+                continue
+            if _is_nonempty_dir(entry.path):
+                names.append(entry.name)
+    return sorted(names)
+
+
+class DatasetEntry(object):
+    """
+    A dataset directory and the Brunnhilde outputs found in it
+
+    Attributes:
+        project (string): name of the project folder
+        name (string): name of the dataset directory (e.g. SET1_brunnout)
+        path (string): full path of the dataset directory
+        siegfried_path (string): path of siegfried.csv, or None
+        csv_reports_path (string): path of csv_reports, or None
+        formats_path (string): path of formats.csv, or None
+        format_versions_path (string): path of formatVersions.csv, or None
+        mimetypes_path (string): path of mimetypes.csv, or None
+        years_path (string): path of years.csv, or None
+        dfxml_path (string): path of dfxml.xml, or None
+        image_path (string): path of a disk image of the dataset, or None
+    """
+
+    def __init__(self, project, name, path):
+        self.project = project
+        self.name = name
+        self.path = path
+        self.siegfried_path = None
+        self.csv_reports_path = None
+        self.formats_path = None
+        self.format_versions_path = None
+        self.mimetypes_path = None
+        self.years_path = None
+        self.dfxml_path = None
+        self.image_path = None
+
+    def missing_files(self, from_image=False):
+        """
+        Args:
+            from_image (bool): file system metadata will be read from the
+                disk image, if there is one, rather than dfxml.xml
+
+        Returns:
+            type: the expected outputs that were not found (array)
+        """
+        missing = []
+        if self.siegfried_path is None:
+            missing.append('siegfried.csv')
+        if self.formats_path is None:
+            missing.append('csv_reports/formats.csv')
+        if self.dfxml_path is None and not (from_image and self.image_path is not None):
+            missing.append('dfxml.xml')
+        return missing
+
+
+class ProjectEntry(object):
+    """
+    A project folder and its dataset directories
+
+    Attributes:
+        name (string): name of the project folder
+        path (string): full path of the project folder
+        datasets (array): DatasetEntry objects, sorted by name
+    """
+
+    def __init__(self, name, path, datasets):
+        self.name = name
+        self.path = path
+        self.datasets = datasets
+
+
+class RepositoryInventory(object):
+    """
+    The project folders and datasets under a local repository directory
+
+    Attributes:
+        path (string): full path of the repository directory
+        name (string): name of the repository directory (its repo_code)
+        projects (array): ProjectEntry objects, sorted by name
+    """
+
+    def __init__(self, path, projects):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.projects = projects
+
+    def datasets(self):
+        for project in self.projects:
+            for dataset in project.datasets:
+                yield dataset
+
+
+def scan_dataset(project, name, path):
+    """
+    Find the Brunnhilde outputs in a dataset directory
+
+    Only the dataset directory itself and its csv_reports folder are
+    listed.
+
+    Returns:
+        type: DatasetEntry
+    """
+    dataset = DatasetEntry(project, name, path)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name == 'siegfried.csv' and entry.is_file():
+                dataset.siegfried_path = entry.path
+            elif entry.name == 'dfxml.xml' and entry.is_file():
+                dataset.dfxml_path = entry.path
+            elif entry.name == 'csv_reports' and entry.is_dir():
+                dataset.csv_reports_path = entry.path
+            elif is_disk_image(entry.name) and entry.is_file():
+                if dataset.image_path is None or entry.name < os.path.basename(dataset.image_path):
+                    dataset.image_path = entry.path
+
+    if dataset.csv_reports_path is not None:
+        with os.scandir(dataset.csv_reports_path) as entries:
+            for entry in entries:
+                attribute = CSV_REPORTS.get(entry.name)
+                if attribute is not None and entry.is_file():
+                    setattr(dataset, attribute, entry.path)
+    return dataset
+
+
+def scan_project(repo_dir, name):
+    path = os.path.join(repo_dir, name)
+    datasets = [scan_dataset(name, dataset_name, os.path.join(path, dataset_name))
+                for dataset_name in list_subdirectories(path)]
+    return ProjectEntry(name, path, datasets)
+
+
+def scan_repository(repo_dir, workers=1):
+    """
+    Build the inventory of a local repository directory
+
+    Args:
+        repo_dir (string): path of the repository directory
+        workers (int): number of project folders scanned in parallel
+
+    Returns:
+        type: RepositoryInventory
+    """
+    project_names = list_subdirectories(repo_dir)
+    if workers is None or workers <= 1 or len(project_names) <= 1:
+        projects = [scan_project(repo_dir, name) for name in project_names]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            projects = list(executor.map(
+                lambda name: scan_project(repo_dir, name), project_names))
+    return RepositoryInventory(repo_dir, projects)
@@ -0,0 +1,312 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# summary.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Per-dataset summaries. A DatasetSummary holds every aggregate
+# bc_to_as.py derives from a dataset's Brunnhilde output. Since that
+# output does not change once Brunnhilde has run, the summary is cached
+# in a small JSON file in the dataset directory, together with a
+# fingerprint of the files it was computed from; later runs load it
+# instead of parsing siegfried.csv and dfxml.xml again. Rollups merge
+# summaries into project and repository level aggregates.
+#
+
+import csv
+import json
+import os
+
+from bc_to_aspace_toolkit import manifest
+from bc_to_aspace_toolkit.timestamps import TimestampRange
+
+SUMMARY_NAME = '.bc_to_as_summary.json'
+
+# Bumped whenever the summary layout or the way it is computed changes,
+# so that older cache files are recomputed
+SUMMARY_VERSION = 2
+
+
+class DatasetSummary(object):
+    """
+    Aggregates of the Brunnhilde output of one dataset
+
+    Attributes:
+        file_count (int): number of files listed in siegfried.csv
+        total_bytes (int): sum of their sizes
+        modified (TimestampRange): range of the Siegfried modified dates
+        formats (dict): Siegfried file counts keyed by (format, PRONOM id)
+        dfxml_file_count (int): number of fileobjects in dfxml.xml
+        dfxml_bytes (int): sum of their sizes
+        mtimes (TimestampRange): range of the DFXML mtimes; None if there
+            is no dfxml.xml
+        format_report (list): [format, PRONOM id, count] rows of
+            formats.csv; None if there is no formats.csv
+        format_versions (list): [format, PRONOM id, version, count] rows
+            of formatVersions.csv, or None
+        mimetypes (list): [MIME type, count] rows of mimetypes.csv, or None
+        years (list): [year, count] rows of years.csv, or None
+        derived_reports (list): names of the attributes above rebuilt from
+            siegfried.csv because Brunnhilde's report was missing
+    """
+
+    def __init__(self):
+        self.file_count = 0
+        self.total_bytes = 0
+        self.modified = TimestampRange()
+        self.formats = {}
+        self.dfxml_file_count = 0
+        self.dfxml_bytes = 0
+        self.mtimes = None
+        self.format_report = None
+        self.format_versions = None
+        self.mimetypes = None
+        self.years = None
+        self.derived_reports = []
+
+    def dfxml_missing(self):
+        return self.mtimes is None
+
+    def mtimes_missing(self):
+        return self.mtimes is not None and self.mtimes.is_empty()
+
+    def date_range(self):
+        """
+        Returns:
+            type: (begin date, end date), from the DFXML mtimes when there
+                are any and from Siegfried otherwise; (None, None) if
+                neither has a valid timestamp
+        """
+        if self.mtimes is not None and not self.mtimes.is_empty():
+            return self.mtimes.begin_date(), self.mtimes.end_date()
+        return self.modified.begin_date(), self.modified.end_date()
+
+    def to_dict(self):
+        return {
+            'file_count': self.file_count,
+            'total_bytes': self.total_bytes,
+            'modified': self.modified.to_dict(),
+            'formats': [[format_name, format_id, count]
+                        for (format_name, format_id), count in sorted(
+                            self.formats.items(), key=lambda item: -item[1])],
+            'dfxml_file_count': self.dfxml_file_count,
+            'dfxml_bytes': self.dfxml_bytes,
+            'mtimes': self.mtimes.to_dict() if self.mtimes is not None else None,
+            'format_report': self.format_report,
+            'format_versions': self.format_versions,
+            'mimetypes': self.mimetypes,
+            'years': self.years,
+            'derived_reports': self.derived_reports,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls()
+        summary.file_count = data['file_count']
+        summary.total_bytes = data['total_bytes']
+        summary.modified = TimestampRange.from_dict(data['modified'])
+        summary.formats = dict(((format_name, format_id), count)
+                               for format_name, format_id, count in data['formats'])
+        summary.dfxml_file_count = data['dfxml_file_count']
+        summary.dfxml_bytes = data['dfxml_bytes']
+        if data['mtimes'] is not None:
+            summary.mtimes = TimestampRange.from_dict(data['mtimes'])
+        summary.format_report = data['format_report']
+        summary.format_versions = data['format_versions']
+        summary.mimetypes = data['mimetypes']
+        summary.years = data['years']
+        summary.derived_reports = data['derived_reports']
+        return summary
+
+
+def read_report(file_path, columns):
+    """
+    Read a Brunnhilde histogram report such as mimetypes.csv, which holds
+    one row per distinct value
+
+    Args:
+        file_path (string): path of the report
+        columns (array): names of the columns to keep; the last one is
+            the count, which is converted to an integer
+
+    Returns:
+        type: rows, as lists of the kept columns (array)
+    """
+    rows = []
+    with open(file_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise ValueError("{} has no {} column".format(file_path, ', '.join(missing)))
+        indexes = [header.index(column) for column in columns]
+        for row in reader:
+            if not row:
+                continue
+            values = [row[i] if i < len(row) else '' for i in indexes]
+            values[-1] = int(values[-1])
+            rows.append(values)
+    return rows
+
+
+def fingerprint(dataset_path, extra_inputs=(), image_engine=None):
+    """
+    Args:
+        dataset_path (string): path of the dataset directory
+        extra_inputs (array): other files the summary is computed from
+            (e.g. a disk image), relative to the dataset directory
+        image_engine (string): engine the disk image is read with
+    """
+    return manifest.fingerprint(dataset_path, names=manifest.INPUT_FILES + tuple(extra_inputs),
+                                image_engine=image_engine)
+
+
+def summary_path(dataset_path):
+    return os.path.join(dataset_path, SUMMARY_NAME)
+
+
+def load_summary(dataset_path, current_fingerprint):
+    """
+    Load the cached summary of a dataset, if it is still valid
+
+    Args:
+        dataset_path (string): path of the dataset directory
+        current_fingerprint (dict): fingerprint of the input files now
+
+    Returns:
+        type: DatasetSummary, or None if there is no cached summary or
+            the inputs have changed since it was written
+    """
+    try:
+        with open(summary_path(dataset_path)) as f:
+            data = json.load(f)
+        if data.get('version') != SUMMARY_VERSION or \
+                data.get('fingerprint') != current_fingerprint:
+            return None
+        return DatasetSummary.from_dict(data['summary'])
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_summary(dataset_path, summary, current_fingerprint):
+    """
+    Cache the summary of a dataset
+
+    The file is replaced atomically, so that an interrupted run never
+    leaves a truncated summary behind.
+
+    Args:
+        dataset_path (string): path of the dataset directory
+        summary (DatasetSummary): the summary to cache
+        current_fingerprint (dict): fingerprint of the input files it was
+            computed from
+
+    Returns:
+        type: path of the cache file (string)
+
+    Raises:
+        OSError: the dataset directory is not writable
+    """
+    path = summary_path(dataset_path)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump({'version': SUMMARY_VERSION, 'fingerprint': current_fingerprint,
+                   'summary': summary.to_dict()}, f, separators=(',', ':'))
+    os.replace(temporary_path, path)
+    return path
+
+
+class Rollup(object):
+    """
+    Mergeable aggregate of many dataset summaries, e.g. all datasets of a
+    project folder or of a repository
+
+    Rollups of disjoint sets of datasets can be merged in any order, so
+    project rollups add up to the repository rollup without going back
+    to the datasets.
+
+    Attributes:
+        dataset_count (int): number of datasets
+        file_count (int): number of files
+        total_bytes (int): sum of the file sizes
+        begin (date): earliest date of any dataset (None if none)
+        end (date): latest date of any dataset (None if none)
+        formats (dict): file counts keyed by (format, PRONOM id)
+    """
+
+    def __init__(self):
+        self.dataset_count = 0
+        self.file_count = 0
+        self.total_bytes = 0
+        self.begin = None
+        self.end = None
+        self.formats = {}
+
+    def _merge_dates(self, begin, end):
+        if begin is not None:
+            if self.begin is None or begin < self.begin:
+                self.begin = begin
+            if self.end is None or end > self.end:
+                self.end = end
+
+    def add_summary(self, summary):
+        """
+        Fold one DatasetSummary into the rollup, using the same date range
+        as its child archival object
+        """
+        self.dataset_count += 1
+        self.file_count += summary.file_count
+        self.total_bytes += summary.total_bytes
+        self._merge_dates(*summary.date_range())
+        for key, count in summary.formats.items():
+            self.formats[key] = self.formats.get(key, 0) + count
+        return self
+
+    def merge(self, other):
+        """
+        Fold another Rollup into this one
+        """
+        self.dataset_count += other.dataset_count
+        self.file_count += other.file_count
+        self.total_bytes += other.total_bytes
+        self._merge_dates(other.begin, other.end)
+        for key, count in other.formats.items():
+            self.formats[key] = self.formats.get(key, 0) + count
+        return self
+
+    def is_empty(self):
+        return self.dataset_count == 0
+
+    def megabytes(self):
+        """
+        Returns:
+            type: total size in megabytes at 2 dec. places (string), as in
+                the extents of child archival objects
+        """
+        return str(round((self.total_bytes / 1048576), 2))
+
+    def describe(self):
+        """
+        Returns:
+            type: one-line description (string)
+        """
+        description = "{} datasets, {} files, {} MB, {} formats".format(
+            self.dataset_count, self.file_count, self.megabytes(), len(self.formats))
+        if self.begin is not None:
+            description += ", {} to {}".format(self.begin, self.end)
+        return description
+
+    def to_dict(self):
+        return {
+            'dataset_count': self.dataset_count,
+            'file_count': self.file_count,
+            'total_bytes': self.total_bytes,
+            'begin': self.begin.isoformat() if self.begin is not None else None,
+            'end': self.end.isoformat() if self.end is not None else None,
+            'formats': [[format_name, format_id, count]
+                        for (format_name, format_id), count in sorted(
+                            self.formats.items(), key=lambda item: -item[1])],
+        }
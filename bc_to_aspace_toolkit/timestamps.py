@@ -0,0 +1,225 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# timestamps.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Vectorized parsing of ISO-8601 timestamps as written by Siegfried and
+# fiwalk. Values are normalized to UTC so that ranges are correct across
+# mixed timezone offsets. pandas is used when it is installed; otherwise
+# values are parsed one by one with the standard library.
+#
+
+import datetime
+import re
+
+from bc_to_aspace_toolkit import utilities
+
+MAX_INVALID_SAMPLES = 5
+
+# Fractional seconds beyond microseconds, which datetime cannot hold
+_EXTRA_DIGITS = re.compile(r'(\.\d{6})\d+')
+
+
+def _to_datetime_kwargs(pd):
+    # pandas >= 2.0 needs to be told that the values are ISO-8601 but may
+    # differ in offset and precision from row to row.
+    if int(pd.__version__.split('.')[0]) >= 2:
+        return {'format': 'ISO8601'}
+    return {}
+
+
+def parse_timestamp(value):
+    """
+    Parse one ISO-8601 timestamp without pandas
+
+    Values without an offset are taken to be in UTC, as pandas does.
+
+    Args:
+        value (string): timestamp string
+
+    Returns:
+        type: UTC datetime, or None if value is malformed
+    """
+    text = value.strip()
+    if text.endswith('Z') or text.endswith('z'):
+        text = text[:-1] + '+00:00'
+    text = _EXTRA_DIGITS.sub(r'\1', text)
+    try:
+        parsed = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.astimezone(datetime.timezone.utc)
+
+
+def _is_missing(value):
+    # None, NaN (which is not equal to itself) and blank strings
+    return value is None or value != value or str(value).strip() == ''
+
+
+class TimestampRange(object):
+    """
+    Earliest and latest timestamp seen in one or more batches of values
+
+    Attributes:
+        begin (datetime): earliest valid timestamp, in UTC (None if none)
+        end (datetime): latest valid timestamp, in UTC (None if none)
+        count (int): number of valid timestamps
+        missing (int): number of empty values
+        invalid (int): number of values that could not be parsed
+        invalid_samples (list): up to MAX_INVALID_SAMPLES malformed values
+    """
+
+    def __init__(self):
+        self.begin = None
+        self.end = None
+        self.count = 0
+        self.missing = 0
+        self.invalid = 0
+        self.invalid_samples = []
+
+    def merge(self, other):
+        """
+        Fold another TimestampRange into this one
+        """
+        if other.begin is not None:
+            if self.begin is None or other.begin < self.begin:
+                self.begin = other.begin
+            if self.end is None or other.end > self.end:
+                self.end = other.end
+        self.count += other.count
+        self.missing += other.missing
+        self.invalid += other.invalid
+        room = MAX_INVALID_SAMPLES - len(self.invalid_samples)
+        self.invalid_samples.extend(other.invalid_samples[:room])
+        return self
+
+    def is_empty(self):
+        return self.count == 0
+
+    def to_dict(self):
+        return {
+            'begin': self.begin.isoformat() if self.begin is not None else None,
+            'end': self.end.isoformat() if self.end is not None else None,
+            'count': self.count,
+            'missing': self.missing,
+            'invalid': self.invalid,
+            'invalid_samples': list(self.invalid_samples),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        result = cls()
+        if data['begin'] is not None:
+            result.begin = datetime.datetime.fromisoformat(data['begin'])
+            result.end = datetime.datetime.fromisoformat(data['end'])
+        result.count = data['count']
+        result.missing = data['missing']
+        result.invalid = data['invalid']
+        result.invalid_samples = list(data['invalid_samples'])
+        return result
+
+    def begin_date(self):
+        return self.begin.date() if self.begin is not None else None
+
+    def end_date(self):
+        return self.end.date() if self.end is not None else None
+
+    def problems(self):
+        """
+        Describe missing or malformed values, if any
+
+        Returns:
+            type: message (string), or "" if every value parsed
+        """
+        if self.missing == 0 and self.invalid == 0:
+            return ''
+        message = "{} missing and {} malformed timestamps".format(
+            self.missing, self.invalid)
+        if self.invalid_samples:
+            message += " (e.g. {})".format(', '.join(
+                repr(sample) for sample in self.invalid_samples))
+        return message
+
+
+def parse_timestamps(values):
+    """
+    Parse a column or array of ISO-8601 timestamps in one call
+
+    Args:
+        values (array-like): timestamp strings; None, NaN and "" are
+            treated as missing
+
+    Returns:
+        type: pandas Series of UTC datetimes, NaT where missing or
+            malformed; without pandas, a list of UTC datetimes with None
+            where missing or malformed
+    """
+    pd = utilities.load_pandas()
+    if pd is None:
+        return [None if _is_missing(value) else parse_timestamp(str(value))
+                for value in values]
+    series = pd.Series(values, dtype='object').str.strip()
+    return pd.to_datetime(series, utc=True, errors='coerce',
+                          **_to_datetime_kwargs(pd))
+
+
+def timestamp_range(values):
+    """
+    Compute the UTC range of a batch of ISO-8601 timestamps
+
+    Args:
+        values (array-like): timestamp strings
+
+    Returns:
+        type: TimestampRange
+    """
+    pd = utilities.load_pandas()
+    if pd is None:
+        return _timestamp_range_stdlib(values)
+
+    raw = pd.Series(values, dtype='object')
+    parsed = parse_timestamps(raw)
+
+    result = TimestampRange()
+    missing = raw.isna() | (raw.astype(str).str.strip() == '')
+    invalid = parsed.isna() & ~missing
+    result.missing = int(missing.sum())
+    result.invalid = int(invalid.sum())
+    if result.invalid:
+        result.invalid_samples = raw[invalid].head(
+            MAX_INVALID_SAMPLES).tolist()
+
+    valid = parsed.dropna()
+    result.count = len(valid)
+    if result.count:
+        # datetime holds microseconds; nanoseconds are dropped, as the
+        #     stdlib parser does, rather than warned about
+        result.begin = valid.min().floor('us').to_pydatetime()
+        result.end = valid.max().floor('us').to_pydatetime()
+    return result
+
+
+def _timestamp_range_stdlib(values):
+    result = TimestampRange()
+    for value in values:
+        if _is_missing(value):
+            result.missing += 1
+            continue
+        parsed = parse_timestamp(str(value))
+        if parsed is None:
+            result.invalid += 1
+            if len(result.invalid_samples) < MAX_INVALID_SAMPLES:
+                result.invalid_samples.append(value)
+            continue
+        result.count += 1
+        if result.begin is None or parsed < result.begin:
+            result.begin = parsed
+        if result.end is None or parsed > result.end:
+            result.end = parsed
+    return result
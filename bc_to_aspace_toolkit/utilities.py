@@ -12,7 +12,20 @@
 
 import os
 import sys
-import pkg_resources
+
+try:
+    from importlib import resources as importlib_resources
+except ImportError:
+    importlib_resources = None
+
+from bc_to_aspace_toolkit import scanner
+
+# Set to use the standard library CSV and timestamp parsers even when
+# pandas (or numpy) is installed
+NO_PANDAS_ENV_VAR = 'BC_TO_AS_NO_PANDAS'
+
+_pandas = []
+_numpy = []
 
 def ask_user(question):
     while "Please enter y or n":
@@ -25,57 +38,110 @@ def ask_user(question):
         if reply[:1] == 'n':
             return False
 
-def get_dir_paths(dir_path, exclude=['__pycache__']):
+def check_repo_structure(repo_dir, assume_yes=False, inventory=None, from_image=False):
     """
-    Get paths of the first-level folders existed in a given folder
+    Print the project and dataset directories found under a repository
+    directory and ask the user to confirm them
 
     Args:
-        dir_path (str): the path of the given folders;
-        exclude (array): the folders don't want to be retrieved;
+        repo_dir (str): path of the repository directory;
+        assume_yes (bool): confirm without asking;
+        inventory (RepositoryInventory): an existing scan of repo_dir;
+        from_image (bool): datasets with a disk image will be read from it;
     Returns:
-        type: folder paths (array).
+        type: the inventory of repo_dir (RepositoryInventory).
     """
-    dir_names = [dirs for root, dirs, files in os.walk(dir_path)][0]
-    results = []
-    for dir in dir_names:
-        if dir not in exclude:
-            path = dir_path + '/' + dir
-            if len(os.listdir(path)) > 0:
-                results.append(path)
-    return results
-
-def check_repo_structure(repo_dir):
     print()
     print("  [INFO] Found repository structure directory {}".format(repo_dir))
     print("  [INFO] Looking for project directories...")
     print()
-    project_dirs = get_dir_paths(repo_dir)
-    if len(project_dirs) == 0:
+    if inventory is None:
+        inventory = scanner.scan_repository(repo_dir)
+    incomplete = []
+    if len(inventory.projects) == 0:
         print("  [ABORT] No project directories found!")
         exit(1)
     else:
-        for project_dir in project_dirs:
-            print("  [INFO] - Found project directory {}".format(project_dir))
-            metadata_dirs = get_dir_paths(project_dir)
-            if len(metadata_dirs) == 0:
-                print("  [ABORT] No metadata directories found in project directory {}!".format(project_dir))
+        for project in inventory.projects:
+            print("  [INFO] - Found project directory {}".format(project.path))
+            if len(project.datasets) == 0:
+                print("  [ABORT] No metadata directories found in project directory {}!".format(project.path))
                 exit(1)
             else:
-                for metadata_dir in metadata_dirs:
-                    print("  [INFO] -- with metadata directory {}".format(metadata_dir))
+                for dataset in project.datasets:
+                    print("  [INFO] -- with metadata directory {}".format(dataset.path))
+                    missing = dataset.missing_files(from_image)
+                    if missing:
+                        incomplete.append((dataset.path, missing))
             print()
-    user_response = ask_user("Is this the correct set of directories?")
+
+    # Report every dataset that will need a fallback up front, rather than
+    # when it is reached
+    if incomplete:
+        print("  [WARNING] {} metadata directories are missing expected files:".format(len(incomplete)))
+        for metadata_dir, missing in incomplete:
+            print("  [WARNING] -- {} (no {})".format(metadata_dir, ', '.join(missing)))
+        print()
+
+    if assume_yes:
+        print("  [INFO] Is this the correct set of directories? Yes (--assume-yes)")
+        user_response = True
+    else:
+        user_response = ask_user("Is this the correct set of directories?")
     if user_response == False:
        print("  [ABORT] Please check the directory structure and try again.")
        exit(1)
     else:
        print("  [INFO] Ok, continuing...")
        print()
+    return inventory
 
 
 def get_json_template(template_name):
     resource_package = "bc_to_aspace_toolkit"  # Exact package name here
-    resource_path = '/'.join(('json_templates', template_name))  # Do not use os.path.join()
     # Read template as file-like stream:
-    template = pkg_resources.resource_stream(resource_package, resource_path)
-    return template
+    if importlib_resources is not None and hasattr(importlib_resources, 'files'):
+        return importlib_resources.files(resource_package).joinpath(
+            'json_templates').joinpath(template_name).open('rb')
+    # Python < 3.9: json_templates is not a package, so open it directly
+    return open(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'json_templates', template_name), 'rb')
+
+
+def load_pandas():
+    """
+    Import pandas on first use, so that runs which never parse a CSV do
+    not pay for it
+
+    Returns:
+        type: the pandas module, or None if it is not installed or
+            BC_TO_AS_NO_PANDAS is set
+    """
+    if not _pandas:
+        module = None
+        if not os.environ.get(NO_PANDAS_ENV_VAR):
+            try:
+                import pandas as module
+            except ImportError:
+                module = None
+        _pandas.append(module)
+    return _pandas[0]
+
+
+def load_numpy():
+    """
+    Import numpy on first use, for the array-based Siegfried scanner
+
+    Returns:
+        type: the numpy module, or None if it is not installed or
+            BC_TO_AS_NO_PANDAS is set
+    """
+    if not _numpy:
+        module = None
+        if not os.environ.get(NO_PANDAS_ENV_VAR):
+            try:
+                import numpy as module
+            except ImportError:
+                module = None
+        _numpy.append(module)
+    return _numpy[0]
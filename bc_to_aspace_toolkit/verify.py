@@ -0,0 +1,159 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# verify.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Reconciliation of ArchivesSpace against the local Brunnhilde output, for
+# bc_to_as.py --verify. The child archival object each dataset would be
+# uploaded as is compared with the record ArchivesSpace holds for it
+# (title, dates, extents and notes), and the outcome of every dataset is
+# collected into a JSON report that can be checked by other tools.
+#
+
+import datetime
+import json
+import os
+
+# Dataset outcomes of a verification
+MATCH = 'match'
+MISMATCH = 'mismatch'
+MISSING = 'missing'
+NO_PARENT = 'no_parent'
+SKIPPED = 'skipped'
+ERROR = 'error'
+OUTCOMES = (MATCH, MISMATCH, MISSING, NO_PARENT, SKIPPED, ERROR)
+
+# Outcomes that mean ArchivesSpace does not hold what the dataset would
+# be uploaded as
+DISCREPANCIES = (MISMATCH, MISSING, NO_PARENT, ERROR)
+
+# Fields of a child archival object that are compared, with the keys
+# compared in each of their entries; other keys (e.g. jsonmodel_type, or
+# those the backend adds) are ignored
+COMPARED_FIELDS = (
+    ('dates', ('begin', 'end', 'expression', 'label')),
+    ('extents', ('number', 'extent_type')),
+    ('notes', ('type', 'label', 'content')),
+)
+
+
+def _entries(values, keys):
+    return [dict((key, value.get(key)) for key in keys) for value in values or []]
+
+
+def compare_child(expected, record):
+    """
+    Compare a child archival object with the record ArchivesSpace holds
+
+    Args:
+        expected (dict): child archival object built from the dataset
+        record (dict): archival object returned by the backend
+
+    Returns:
+        type: differences, as {'field', 'local', 'remote'} dicts (array);
+            empty if the record matches
+    """
+    differences = []
+    if expected.get('title') != record.get('title'):
+        differences.append({'field': 'title', 'local': expected.get('title'),
+                            'remote': record.get('title')})
+    for field, keys in COMPARED_FIELDS:
+        local = _entries(expected.get(field), keys)
+        remote = _entries(record.get(field), keys)
+        if local != remote:
+            differences.append({'field': field, 'local': local, 'remote': remote})
+    return differences
+
+
+class Reconciliation(object):
+    """
+    Outcome of verifying the datasets of one or more repositories
+
+    Args:
+        host (string): URL of the ArchivesSpace backend verified against
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.repositories = []
+
+    def add_repository(self, name, uri):
+        """
+        Returns:
+            type: the report entry of the repository (dict), to add its
+                datasets to; uri is None if it does not exist in
+                ArchivesSpace
+        """
+        repository = {'name': name, 'uri': uri,
+                      'counts': dict((outcome, 0) for outcome in OUTCOMES),
+                      'datasets': []}
+        self.repositories.append(repository)
+        return repository
+
+    def add_dataset(self, repository, project_folder, dataset_dir, title, status,
+                    uri=None, differences=(), detail=None):
+        """
+        Record the outcome of one dataset
+
+        Args:
+            repository (dict): entry returned by add_repository
+            project_folder (string): name of the project folder
+            dataset_dir (string): name of the dataset directory
+            title (string): title of its child archival object
+            status (string): one of OUTCOMES
+            uri (string): URI of the child archival object, if found
+            differences (array): differences found by compare_child
+            detail (string): reason for an error or skip
+        """
+        entry = {'project': project_folder, 'dataset': dataset_dir, 'title': title,
+                 'status': status, 'uri': uri}
+        if differences:
+            entry['differences'] = list(differences)
+        if detail is not None:
+            entry['detail'] = detail
+        repository['datasets'].append(entry)
+        repository['counts'][status] += 1
+
+    def counts(self):
+        """
+        Returns:
+            type: dict mapping each outcome to its number of datasets
+        """
+        totals = dict((outcome, 0) for outcome in OUTCOMES)
+        for repository in self.repositories:
+            for outcome, count in repository['counts'].items():
+                totals[outcome] += count
+        return totals
+
+    def discrepancies(self):
+        """
+        Returns:
+            type: number of datasets, plus repositories missing from
+                ArchivesSpace, that do not match (int)
+        """
+        counts = self.counts()
+        return sum(counts[outcome] for outcome in DISCREPANCIES) + \
+            sum(1 for repository in self.repositories if repository['uri'] is None)
+
+    def to_dict(self):
+        return {
+            'generated': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'host': self.host,
+            'counts': self.counts(),
+            'repositories': self.repositories,
+        }
+
+    def write(self, path):
+        """
+        Write the report as JSON; the file is replaced atomically
+        """
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(temporary_path, path)
+        return path
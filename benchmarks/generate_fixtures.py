@@ -0,0 +1,179 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# generate_fixtures.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Generates a synthetic local repository structure for benchmarking
+# bc_to_as.py: N project folders of M dataset directories, each holding a
+# siegfried.csv, the Brunnhilde csv_reports and a dfxml.xml describing the
+# same files, e.g.
+#
+#   python benchmarks/generate_fixtures.py /tmp/bench-repository -p 4 -d 10 -r 100000
+#
+
+import csv
+import datetime
+import os
+import random
+from argparse import ArgumentParser
+
+SIEGFRIED_HEADER = ['filename', 'filesize', 'modified', 'errors', 'sha1', 'namespace',
+                    'id', 'format', 'version', 'mime', 'basis', 'warning']
+
+# (format, PRONOM id, version, MIME type, extension)
+FORMATS = [
+    ('JPEG File Interchange Format', 'fmt/43', '1.01', 'image/jpeg', 'jpg'),
+    ('Tagged Image File Format', 'fmt/353', '', 'image/tiff', 'tif'),
+    ('Portable Network Graphics', 'fmt/13', '1.2', 'image/png', 'png'),
+    ('Acrobat PDF 1.4 - Portable Document Format', 'fmt/18', '1.4', 'application/pdf', 'pdf'),
+    ('Microsoft Word Document', 'fmt/40', '97-2003', 'application/msword', 'doc'),
+    ('Plain Text File', 'x-fmt/111', '', 'text/plain', 'txt'),
+    ('', 'UNKNOWN', '', '', 'dat'),
+]
+
+DFXML_NAMESPACE = 'http://www.forensicswiki.org/wiki/Category:Digital_Forensics_XML'
+
+DFXML_LAYOUTS = ('volume', 'bare', 'alternate', 'none')
+
+
+class _Histogram(object):
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, key):
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def most_common(self):
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+def _random_rows(rng, rows, start, span_seconds):
+    for i in range(rows):
+        name, puid, version, mime, extension = FORMATS[min(int(rng.expovariate(0.8)), len(FORMATS) - 1)]
+        filesize = int(rng.lognormvariate(11, 2.5))
+        modified = start + datetime.timedelta(seconds=rng.randrange(span_seconds))
+        yield ('/d/acquisitions/objects/dir{:04d}/file{:08d}.{}'.format(i // 1000, i, extension),
+               filesize, modified, name, puid, version, mime, extension)
+
+
+def write_dataset(path, rows, dfxml_layout, rng):
+    """
+    Write siegfried.csv, csv_reports/*.csv and dfxml.xml for one dataset
+
+    Args:
+        path (string): the dataset directory (created if needed)
+        rows (int): number of files described
+        dfxml_layout (string): 'volume' wraps the fileobjects in a volume
+            element, 'bare' does not, 'none' writes no dfxml.xml
+        rng (random.Random): source of the generated values
+    """
+    csv_reports = os.path.join(path, 'csv_reports')
+    if not os.path.isdir(csv_reports):
+        os.makedirs(csv_reports)
+
+    start = datetime.datetime(1995, 1, 1) + datetime.timedelta(days=rng.randrange(8000))
+    span_seconds = 86400 * rng.randrange(1, 2000)
+    formats = _Histogram()
+    versions = _Histogram()
+    mimetypes = _Histogram()
+    years = _Histogram()
+
+    dfxml_file = None
+    if dfxml_layout != 'none':
+        dfxml_file = open(os.path.join(path, 'dfxml.xml'), 'w')
+        dfxml_file.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        dfxml_file.write("<dfxml xmlns='{}' version='1.0'>\n".format(DFXML_NAMESPACE))
+        dfxml_file.write("<creator><program>generate_fixtures.py</program></creator>\n")
+        if dfxml_layout == 'volume':
+            dfxml_file.write("<volume offset='0'>\n<ftype_str>fat32</ftype_str>\n")
+
+    with open(os.path.join(path, 'siegfried.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(SIEGFRIED_HEADER)
+        for filename, filesize, modified, name, puid, version, mime, extension in \
+                _random_rows(rng, rows, start, span_seconds):
+            basis = 'extension match {}; byte match at 0, {} (signature 1/2)'.format(
+                extension, rng.randrange(4, 64)) if name else ''
+            writer.writerow([filename, filesize, modified.strftime('%Y-%m-%dT%H:%M:%S-04:00'),
+                             '', '%040x' % rng.getrandbits(160), 'pronom', puid, name,
+                             version, mime, basis, '' if name else 'no match'])
+            formats.add((name, puid))
+            versions.add((name, puid, version))
+            mimetypes.add(mime)
+            years.add(modified.year)
+
+            if dfxml_file is not None:
+                dfxml_file.write(
+                    "<fileobject><filename>{}</filename><filesize>{}</filesize>"
+                    "<mtime>{}</mtime><crtime>{}</crtime></fileobject>\n".format(
+                        filename, filesize, modified.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                        start.strftime('%Y-%m-%dT%H:%M:%SZ')))
+
+    if dfxml_file is not None:
+        if dfxml_layout == 'volume':
+            dfxml_file.write("</volume>\n")
+        dfxml_file.write("</dfxml>\n")
+        dfxml_file.close()
+
+    reports = [
+        ('formats.csv', ['Format', 'ID', 'Count'], [list(key) + [n] for key, n in formats.most_common()]),
+        ('formatVersions.csv', ['Format', 'ID', 'Version', 'Count'], [list(key) + [n] for key, n in versions.most_common()]),
+        ('mimetypes.csv', ['MIME type', 'Count'], [[key, n] for key, n in mimetypes.most_common()]),
+        ('years.csv', ['Year Last Modified', 'Count'], [[key, n] for key, n in sorted(years.counts.items())]),
+    ]
+    for name, header, report_rows in reports:
+        with open(os.path.join(csv_reports, name), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(report_rows)
+
+
+def generate_repository(repo_dir, projects=2, datasets=3, rows=3200,
+                        dfxml_layout='alternate', seed=0):
+    """
+    Generate a synthetic local repository structure
+
+    Args:
+        repo_dir (string): repository directory; its name is the repo_code
+        projects (int): number of project folders
+        datasets (int): number of dataset directories per project
+        rows (int): number of files per dataset
+        dfxml_layout (string): one of DFXML_LAYOUTS; 'alternate' switches
+            between volume and bare layouts from one dataset to the next
+        seed (int): random seed, so that fixtures can be regenerated
+
+    Returns:
+        type: number of dataset directories written (int)
+    """
+    rng = random.Random(seed)
+    count = 0
+    for p in range(projects):
+        for d in range(datasets):
+            layout = dfxml_layout
+            if layout == 'alternate':
+                layout = ('volume', 'bare')[count % 2]
+            path = os.path.join(repo_dir, 'project{}'.format(p + 1),
+                                'BENCH{:02d}-SET-{:04d}_brunnout'.format(p + 1, d + 1))
+            write_dataset(path, rows, layout, rng)
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(prog='generate_fixtures.py', description='Generate a synthetic repository structure for benchmarking bc_to_as.py')
+    parser.add_argument('repodir', help="Repository directory to create; its name is used as the repo_code")
+    parser.add_argument('-p', '--projects', type=int, default=2, help="Number of project folders (default: %(default)s)")
+    parser.add_argument('-d', '--datasets', type=int, default=3, help="Number of datasets per project (default: %(default)s)")
+    parser.add_argument('-r', '--rows', type=int, default=3200, help="Number of files per dataset (default: %(default)s)")
+    parser.add_argument('--dfxml-layout', choices=DFXML_LAYOUTS, default='alternate', help="Wrap fileobjects in a volume element, or not, or alternate, or write no dfxml.xml (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: %(default)s)")
+    args = parser.parse_args()
+
+    n = generate_repository(args.repodir, args.projects, args.datasets, args.rows,
+                            args.dfxml_layout, args.seed)
+    print("  [INFO] Wrote {} datasets of {} files to {}".format(n, args.rows, args.repodir))
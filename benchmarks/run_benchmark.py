@@ -0,0 +1,230 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# run_benchmark.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Times the stages of bc_to_as.py over a local repository structure
+# (usually one written by generate_fixtures.py), then a full run_session
+# against the in-memory mock backend, and reports wall time and peak
+# resident memory for each. Every stage runs in a fresh interpreter, as
+# the peak resident size of a process never goes down; the figures
+# include that of the interpreter and its imports. E.g.
+#
+#   python benchmarks/run_benchmark.py /tmp/bench-repository --generate -d 10 -r 100000
+#
+
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bc_to_as
+from bc_to_aspace_toolkit import dfxml
+from bc_to_aspace_toolkit import extract
+from bc_to_aspace_toolkit import scanner
+from bc_to_aspace_toolkit import siegfried
+from bc_to_aspace_toolkit.mock_backend import MockArchivesSpace
+
+import generate_fixtures
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """
+    Returns:
+        type: peak resident set size so far, in megabytes (float)
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+    if sys.platform == 'darwin':
+        return peak / 1048576.0
+    return peak / 1024.0
+
+
+def summary_key(summary):
+    """
+    Returns:
+        type: the aggregates of a SiegfriedSummary, for comparison (tuple)
+    """
+    return (summary.file_count, summary.total_bytes, summary.modified.to_dict(),
+            sorted(summary.formats.items(), key=str), summary.reports())
+
+
+def scan_stage(repo_dir, workers):
+    inventory = scanner.scan_repository(repo_dir, workers)
+    return {'datasets': len(list(inventory.datasets()))}
+
+
+def siegfried_stage(datasets, engine):
+    rows = 0
+    size = 0
+    summaries = []
+    for dataset in datasets:
+        summary = siegfried.summarize_siegfried(dataset.siegfried_path, engine=engine)
+        summaries.append(summary_key(summary))
+        rows += summary.file_count
+        size += os.path.getsize(dataset.siegfried_path)
+    # The summaries are compared with those of pandas once every stage
+    #     has run, and then dropped
+    return {'rows': rows, 'mb': round(size / 1048576.0, 1), 'summaries': summaries}
+
+
+def dfxml_stage(datasets):
+    fileobjects = 0
+    size = 0
+    for dataset in datasets:
+        if dataset.dfxml_path is not None:
+            fileobjects += dfxml.summarize_dfxml(dataset.dfxml_path).file_count
+            size += os.path.getsize(dataset.dfxml_path)
+    return {'fileobjects': fileobjects, 'mb': round(size / 1048576.0, 1)}
+
+
+def extract_stage(datasets, workers):
+    results = extract.extract_datasets(datasets, workers)
+    return {'workers': workers,
+            'errors': sum(1 for result in results if result.error is not None)}
+
+
+def session_stage(repo_dir, inventory, workers, concurrency, batch_size, latency):
+    backend = MockArchivesSpace([inventory.name], latency=latency).start()
+    os.environ.update({'ASPACE_URL': backend.url, 'ASPACE_USERNAME': 'benchmark',
+                       'ASPACE_PASSWORD': 'benchmark'})
+    try:
+        options, file_credentials = bc_to_as.parse_options([
+            repo_dir, '--non-interactive', '--no-cache', '--no-manifest', '--no-summary-cache',
+            '--on-missing-dfxml', 'siegfried', '--on-missing-mtimes', 'siegfried',
+            '-w', str(workers), '-c', str(concurrency), '-b', str(batch_size)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            bc_to_as.run_session(repo_dir, options, file_credentials, inventory)
+        return {'requests': backend.request_count, 'latency': latency,
+                'concurrency': concurrency, 'batch_size': batch_size}
+    finally:
+        backend.stop()
+
+
+def _stage_process(connection, function, kwargs):
+    start = time.perf_counter()
+    details = function(**kwargs)
+    seconds = time.perf_counter() - start
+    connection.send((details, seconds, peak_rss_mb(),
+                     peak_rss_mb(resource.RUSAGE_CHILDREN)))
+    connection.close()
+
+
+class Benchmark(object):
+    """
+    Collects the wall time and memory high-water mark of each stage
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    def stage(self, name, function, **kwargs):
+        """
+        Run function(**kwargs) in a new interpreter, timing it and
+        reading its peak resident size, and that of the worker processes
+        it started
+
+        Returns:
+            type: the details dict returned by function
+        """
+        print("  [INFO] Running stage {}...".format(name))
+        context = multiprocessing.get_context('spawn')
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_stage_process, args=(sender, function, kwargs))
+        process.start()
+        sender.close()
+        try:
+            details, seconds, peak, children_peak = receiver.recv()
+        except EOFError:
+            raise RuntimeError("Stage {} failed".format(name))
+        finally:
+            process.join()
+        self.stages.append(dict(details, stage=name, seconds=round(seconds, 3),
+                                peak_rss_mb=round(peak, 1),
+                                peak_children_rss_mb=round(children_peak, 1)))
+        return self.stages[-1]
+
+    def report(self):
+        print()
+        print("  {:<16} {:>10} {:>14} {:>14}  {}".format('stage', 'seconds', 'peak RSS (MB)', 'workers (MB)', 'details'))
+        for stage in self.stages:
+            details = ', '.join('{}={}'.format(key, value) for key, value in sorted(stage.items())
+                                if key not in ('stage', 'seconds', 'peak_rss_mb', 'peak_children_rss_mb'))
+            print("  {:<16} {:>10.3f} {:>14.1f} {:>14.1f}  {}".format(
+                stage['stage'], stage['seconds'], stage['peak_rss_mb'],
+                stage['peak_children_rss_mb'], details))
+
+
+def run_benchmark(repo_dir, workers, concurrency, batch_size, latency):
+    """
+    Time each stage over repo_dir
+
+    Returns:
+        type: Benchmark
+    """
+    bench = Benchmark()
+    inventory = scanner.scan_repository(repo_dir, workers)
+    datasets = list(inventory.datasets())
+
+    bench.stage('scan', scan_stage, repo_dir=repo_dir, workers=workers)
+    engines = ('mmap', 'csv', 'pandas')
+    for engine in engines:
+        bench.stage('siegfried_' + engine, siegfried_stage, datasets=datasets, engine=engine)
+    bench.stage('dfxml', dfxml_stage, datasets=datasets)
+    bench.stage('extract', extract_stage, datasets=datasets, workers=workers)
+    bench.stage('session', session_stage, repo_dir=repo_dir, inventory=inventory,
+                workers=workers, concurrency=concurrency, batch_size=batch_size,
+                latency=latency)
+
+    # Check that every siegfried.csv engine agrees with pandas
+    stages = dict((stage['stage'], stage) for stage in bench.stages)
+    reference = stages['siegfried_pandas']['summaries']
+    for engine in engines:
+        stage = stages['siegfried_' + engine]
+        stage['matches_pandas'] = stage.pop('summaries') == reference
+
+    return bench
+
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(prog='run_benchmark.py', description='Time the stages of bc_to_as.py against the mock ArchivesSpace backend')
+    parser.add_argument('repodir', help="Repository directory to benchmark")
+    parser.add_argument('--generate', action='store_true', help="(Re)generate repodir with generate_fixtures.py first")
+    parser.add_argument('-p', '--projects', type=int, default=2, help="Projects to generate (default: %(default)s)")
+    parser.add_argument('-d', '--datasets', type=int, default=3, help="Datasets per project to generate (default: %(default)s)")
+    parser.add_argument('-r', '--rows', type=int, default=3200, help="Files per generated dataset (default: %(default)s)")
+    parser.add_argument('--dfxml-layout', choices=generate_fixtures.DFXML_LAYOUTS, default='alternate', help="DFXML layout of generated datasets (default: %(default)s)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help="Extraction worker processes (default: number of CPUs)")
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help="Simultaneous uploads (default: %(default)s)")
+    parser.add_argument('-b', '--batch-size', type=int, default=1, help="Children per request (default: %(default)s)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds the mock backend adds to every response (default: %(default)s)")
+    parser.add_argument('--json', metavar='FILE', help="Also write the results to FILE as JSON")
+    args = parser.parse_args()
+
+    repo_dir = args.repodir.rstrip('/')
+    if args.generate:
+        if os.path.isdir(repo_dir):
+            shutil.rmtree(repo_dir)
+        start = time.perf_counter()
+        generate_fixtures.generate_repository(repo_dir, args.projects, args.datasets,
+                                              args.rows, args.dfxml_layout)
+        print("  [INFO] Generated {} in {:.1f}s".format(repo_dir, time.perf_counter() - start))
+
+    bench = run_benchmark(repo_dir, args.workers, args.concurrency, args.batch_size, args.latency)
+    bench.report()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'repodir': repo_dir, 'stages': bench.stages}, f, indent=2)
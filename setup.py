@@ -18,7 +18,10 @@ setup(
     keywords = 'metadata identification disk images',
 
     platforms = ['POSIX', 'Windows'],
-    install_requires=['pandas', 'pathlib', 'xmltodict'],
+    python_requires='>=3.7',
+    install_requires=['requests'],
+    # Faster siegfried.csv parsing; the standard library is used without them
+    extras_require={'fast': ['numpy', 'pandas']},
     classifiers = [
         'Development Status :: 2 - Pre-Alpha',
         'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
@@ -29,10 +32,12 @@ setup(
         'Operating System :: MacOS :: MacOS X',
         'Operating System :: POSIX :: Linux',
         'Operating System :: Microsoft :: Windows',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Topic :: Software Development :: Libraries :: Python Modules',
         'Topic :: Utilities'
     ],
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# coding=UTF-8
+#
+# test_manifest.py
+#
+# This code is distributed under the terms of the GNU General Public
+# License, Version 3. See the text file "COPYING" for further details
+# about the terms of this license.
+#
+# Tests of the run manifest: records written against one ArchivesSpace
+# backend must not be trusted by a run against another, and a run over
+# an uploaded repository brings its records up to date.
+#
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from bc_to_aspace_toolkit.manifest import MANIFEST_NAME, RunManifest, NEW, UNCHANGED
+from bc_to_aspace_toolkit.mock_backend import MockArchivesSpace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_REPOSITORY = os.path.join(ROOT, 'attic', 'repository-and-project-samples',
+                                 'ossarcflow-repository')
+
+
+class RunManifestHostTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repo_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repo_dir)
+
+    def test_records_of_another_host_are_ignored(self):
+        first = RunManifest(self.repo_dir, host='http://first:8089/')
+        first.record_done('project1/dataset', {'siegfried.csv': [1, 2]},
+                          '/repositories/2/archival_objects/7')
+
+        again = RunManifest(self.repo_dir, host='http://first:8089')
+        self.assertEqual(again.status('project1/dataset', {'siegfried.csv': [1, 2]}), UNCHANGED)
+        self.assertEqual(again.uri('project1/dataset'), '/repositories/2/archival_objects/7')
+
+        other = RunManifest(self.repo_dir, host='http://second:8089')
+        self.assertEqual(other.status('project1/dataset', {'siegfried.csv': [1, 2]}), NEW)
+        self.assertIsNone(other.uri('project1/dataset'))
+
+
+class SwitchBackendTest(unittest.TestCase):
+    """
+    Upload the sample repository to one mock backend, then to another
+    """
+
+    def setUp(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        self.repo_dir = os.path.join(work_dir, 'ossarcflow-repository')
+        shutil.copytree(SAMPLE_REPOSITORY, self.repo_dir)
+        self.cache_file = os.path.join(work_dir, 'cache.sqlite')
+        self.backends = []
+        for _ in range(2):
+            backend = MockArchivesSpace(repositories=('ossarcflow-repository',)).start()
+            self.addCleanup(backend.stop)
+            self.backends.append(backend)
+
+    def upload(self, backend):
+        env = dict(os.environ, ASPACE_URL=backend.url, ASPACE_USERNAME='admin',
+                   ASPACE_PASSWORD='admin', ASPACE_CREATED_BY='admin')
+        subprocess.check_output(
+            [sys.executable, os.path.join(ROOT, 'bc_to_as.py'), '-y', '--non-interactive',
+             '--on-missing-dfxml', 'siegfried', '--on-missing-mtimes', 'siegfried',
+             '--cache-file', self.cache_file, '-w', '1', self.repo_dir],
+            env=env, stderr=subprocess.STDOUT, cwd=ROOT)
+
+    def children(self, backend):
+        return sum(len(uris) for uris in backend.children.values())
+
+    def test_manifest_records_the_uri_of_each_child(self):
+        backend = self.backends[0]
+        self.upload(backend)
+        with open(os.path.join(self.repo_dir, MANIFEST_NAME)) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        records = [record for record in records if record['status'] == 'done']
+        self.assertEqual(len(records), 6)
+        for record in records:
+            child = backend.records[record['uri']]
+            project_folder, dataset_dir = record['key'].split('/')
+            self.assertEqual(child['ref_id'], project_folder + '__' + dataset_dir)
+            self.assertEqual(child['title'], dataset_dir.split('_')[0])
+
+    def test_new_dataset_updates_project_resource(self):
+        backend = self.backends[0]
+        dataset_dir = os.path.join(self.repo_dir, 'project1', 'RL11654-SET-0003_brunnout')
+        moved_dir = os.path.join(os.path.dirname(self.repo_dir), 'RL11654-SET-0003_brunnout')
+        shutil.move(dataset_dir, moved_dir)
+        self.upload(backend)
+        resources = dict((record['title'], record) for uri, record in backend.records.items()
+                         if '/resources/' in uri)
+        self.assertEqual(resources['project1']['extents'][0]['number'], '34433.66')
+
+        shutil.move(moved_dir, dataset_dir)
+        self.upload(backend)
+        resources = dict((record['title'], record) for uri, record in backend.records.items()
+                         if '/resources/' in uri)
+        self.assertEqual(len(resources), 2)
+        self.assertEqual(resources['project1']['extents'][0]['number'],
+                         resources['project2']['extents'][0]['number'])
+
+    def test_second_backend_gets_every_dataset(self):
+        self.upload(self.backends[0])
+        self.assertEqual(self.children(self.backends[0]), 6)
+
+        self.upload(self.backends[1])
+        self.assertEqual(self.children(self.backends[1]), 6)
+
+        # Back on the first backend, nothing is uploaded twice
+        self.upload(self.backends[0])
+        self.assertEqual(self.children(self.backends[0]), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()